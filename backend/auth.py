@@ -1,41 +1,67 @@
 from datetime import datetime, timedelta
 from typing import Optional
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
+import bcrypt
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from cachetools import TTLCache
+from contextvars import ContextVar
+import asyncio
+import hashlib
 import os
+import threading
+import time
 
-from database import get_db, User as UserModel
-from models import TokenData, User
+from database import SessionLocal, User as UserModel
+from models import User
 
 # Configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+# bcrypt work factor for new hashes (cost doubles per round); only paid at login/user updates
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Decoded JWT payloads keyed by the raw bearer token, so repeated requests with the
+# same token skip signature verification. Entries never outlive the token's exp claim.
+TOKEN_CACHE_TTL = 60
+_token_cache = TTLCache(maxsize=4096, ttl=TOKEN_CACHE_TTL)
+_token_cache_lock = threading.Lock()
+
+# Users resolved from a token, keyed by the token's SHA-256. Short TTL bounds how long
+# a change made by another process can go unnoticed; local admin edits invalidate explicitly.
+USER_CACHE_TTL = 30
+_user_cache = TTLCache(maxsize=10000, ttl=USER_CACHE_TTL)
+_user_cache_lock = threading.Lock()
+
+# Whether the current request's user is an admin, decided once by AuthMiddleware;
+# None when the middleware did not resolve a user for this request
+_request_is_admin: ContextVar[Optional[bool]] = ContextVar("request_is_admin", default=None)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
 
 def get_password_hash(password: str) -> str:
     """Hash a password"""
-    return pwd_context.hash(password)
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode()
 
 def get_user(db: Session, username: str) -> Optional[UserModel]:
     """Get user by username"""
-    return db.query(UserModel).filter(UserModel.username == username).first()
+    # 2.0-style select on the unique username index; avoids the legacy Query API
+    return db.execute(select(UserModel).where(UserModel.username == username)).scalar_one_or_none()
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[UserModel]:
+async def authenticate_user(db: Session, username: str, password: str) -> Optional[UserModel]:
     """Authenticate user with username and password"""
     user = get_user(db, username)
     if not user:
         return None
-    if not verify_password(password, user.password):
+    # bcrypt is CPU-bound; verify in a worker thread so the event loop keeps serving requests
+    if not await asyncio.to_thread(verify_password, password, user.password):
         return None
     if user.is_active != "Active":
         return None
@@ -53,24 +79,93 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
-    """Get current user from JWT token"""
+def _verify_cached(token: str) -> dict:
+    """Decode a JWT, reusing the cached payload while it is still valid"""
+    with _token_cache_lock:
+        entry = _token_cache.get(token)
+    if entry is not None:
+        payload, expires_at = entry
+        if time.monotonic() < expires_at:
+            return payload
+    try:
+        payload = jwt.decode(
+            token,
+            SECRET_KEY,
+            algorithms=[ALGORITHM],
+            options={"require_exp": True, "require_sub": True},
+        )
+    except JWTError:
+        with _token_cache_lock:
+            _token_cache.pop(token, None)
+        raise
+    ttl = TOKEN_CACHE_TTL
+    exp = payload.get("exp")
+    if exp is not None:
+        ttl = min(float(exp) - time.time(), TOKEN_CACHE_TTL)
+    if ttl > 0:
+        with _token_cache_lock:
+            _token_cache[token] = (payload, time.monotonic() + ttl)
+    return payload
+
+def _load_user(token: str) -> Optional[UserModel]:
+    """Resolve a bearer token to its (detached) user, or None if invalid"""
+    try:
+        # Checked before the user cache so a cached user never outlives the token's exp;
+        # exp and sub are enforced during decode, so sub is always present here
+        username: str = _verify_cached(token)["sub"]
+    except JWTError:
+        return None
+    key = hashlib.sha256(token.encode()).hexdigest()[:32]
+    with _user_cache_lock:
+        user = _user_cache.get(key)
+    if user is not None:
+        return user
+    with SessionLocal() as db:
+        user = get_user(db, username=username)
+    if user is not None:
+        with _user_cache_lock:
+            _user_cache[key] = user
+    return user
+
+def invalidate_user_cache(user_id: int) -> None:
+    """Drop cached users for user_id (after password/role/status changes or deletion)"""
+    with _user_cache_lock:
+        for key in [k for k, u in _user_cache.items() if u.id == user_id]:
+            _user_cache.pop(key, None)
+
+class AuthMiddleware:
+    """Pure ASGI middleware: resolve the bearer token once per request into scope["state"]["user"].
+    Requests without a token pass through untouched; endpoints decide whether auth is required.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            for name, value in scope["headers"]:
+                if name == b"authorization":
+                    scheme, _, token = value.decode("latin-1").partition(" ")
+                    if scheme.lower() == "bearer" and token:
+                        user = _load_user(token)
+                        is_admin = user is not None and str(user.role or '').lower() == 'admin'
+                        state = scope.setdefault("state", {})
+                        state["user"] = user
+                        state["is_admin"] = is_admin
+                        _request_is_admin.set(is_admin)
+                    break
+        await self.app(scope, receive, send)
+
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme)) -> User:
+    """Get current user from JWT token (resolved by AuthMiddleware)"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-    
-    user = get_user(db, username=token_data.username)
+    state = request.scope.get("state") or {}
+    # Fall back to resolving here if the app was mounted without the middleware
+    user = state["user"] if "user" in state else _load_user(token)
     if user is None:
         raise credentials_exception
     
@@ -82,10 +177,22 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
+def user_is_admin(user: User) -> bool:
+    """Admin check for the request's user, using the flag AuthMiddleware already computed"""
+    flag = _request_is_admin.get()
+    if flag is None:
+        flag = str(getattr(user, 'role', None) or '').lower() == 'admin'
+    return flag
+
+def normalize_role(role: Optional[str]) -> str:
+    """Canonical form of a role name, as carried in the token's role claim"""
+    return str(role or '').strip().lower()
+
 # New: Admin-only dependency
 async def get_current_admin_user(current_user: User = Depends(get_current_user)) -> User:
     """Ensure the current user has admin role"""
-    role = getattr(current_user, "role", None)
-    if str(role or '').strip().lower() != "admin":
+    # Decided from the role just loaded for the user (not the token's role claim), so a
+    # demotion applies to tokens that are already issued
+    if normalize_role(getattr(current_user, "role", None)) != "admin":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
     return current_user
@@ -1,7 +1,7 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DECIMAL, DateTime
+from sqlalchemy import create_engine, event, func, Column, Integer, String, Text, DECIMAL, DateTime
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from datetime import datetime, timezone
+from sqlalchemy.orm import relationship, sessionmaker
 import os
 from dotenv import load_dotenv
 
@@ -9,7 +9,34 @@ load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./service_tool.db")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    # Reuse connections across requests instead of reopening (and re-running PRAGMAs)
+    poolclass=QueuePool,
+    pool_size=10,
+    max_overflow=20,
+)
+
+# SQLite tuning: WAL lets readers proceed during Excel imports, NORMAL sync is safe under WAL
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+)
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in SQLITE_PRAGMAS:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -17,7 +44,7 @@ class Part(Base):
     __tablename__ = "parts"
     
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    code = Column(String(100), index=True, nullable=False)
+    code = Column(String(100), unique=True, index=True, nullable=False)
     description = Column(Text)
     map_price = Column(DECIMAL(10, 2))
     status = Column(String(20), default="Active")
@@ -26,14 +53,16 @@ class Part(Base):
     stock_qty = Column(Integer, default=0)
     gr_qty = Column(Integer, default=0)
     gr_usd = Column(DECIMAL(10, 2))
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    # Timestamps are stamped by SQLite: CURRENT_TIMESTAMP is rendered into the INSERT/UPDATE
+    # (legacy tables may lack the column DEFAULT), so no Python datetime is built per row
+    created_at = Column(DateTime, default=func.current_timestamp(), server_default=func.current_timestamp())
+    updated_at = Column(DateTime, default=func.current_timestamp(), server_default=func.current_timestamp(), onupdate=func.current_timestamp())
 
 class Formula(Base):
     __tablename__ = "formulas"
     
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    class_name = Column(String(50), nullable=False)  # LOW End, Mid End, etc.
+    class_name = Column(String(50), unique=True, index=True, nullable=False)  # LOW End, Mid End, etc.
     labor_lvl2 = Column(DECIMAL(10, 2))
     labor_lvl3 = Column(DECIMAL(10, 2))
     # New extended labor levels and pricing overrides
@@ -50,8 +79,8 @@ class Formula(Base):
     dealer_labor_lvl2_minor = Column(DECIMAL(10, 2))
     dealer_labor_lvl3 = Column(DECIMAL(10, 2))
     dealer_margin = Column(DECIMAL(10, 2))
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=func.current_timestamp(), server_default=func.current_timestamp())
+    updated_at = Column(DateTime, default=func.current_timestamp(), server_default=func.current_timestamp(), onupdate=func.current_timestamp())
 
 class User(Base):
     __tablename__ = "users"
@@ -65,7 +94,14 @@ class User(Base):
     permissions = Column(Text, nullable=True)
     # New: track creator (admin who created this user)
     created_by_id = Column(Integer, nullable=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=func.current_timestamp(), server_default=func.current_timestamp())
+    # Creator lookup; the column has no FK constraint (legacy tables), so the join is spelled out.
+    # Read-only: created_by_id is what endpoints set.
+    created_by = relationship(
+        "User",
+        primaryjoin="foreign(User.created_by_id) == remote(User.id)",
+        viewonly=True,
+    )
 
 # New table to manage Samsung models and their categories
 class SamsungModel(Base):
@@ -77,24 +113,74 @@ class SamsungModel(Base):
     # Allowed values (free-form string for simplicity): highend, lowend, tab, wearable
     category = Column(String(20), nullable=True)
     model_code = Column(String(100), nullable=True, index=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=func.current_timestamp(), server_default=func.current_timestamp())
+    updated_at = Column(DateTime, default=func.current_timestamp(), server_default=func.current_timestamp(), onupdate=func.current_timestamp())
+
+
+class AppMeta(Base):
+    """Small key/value store for app state kept in the database (seed hash, revisions)"""
+    __tablename__ = "app_meta"
+
+    key = Column(Text, primary_key=True)
+    value = Column(Text, nullable=False)
+
+
+# app_meta key bumped by triggers on every samsung_models write, from any connection or
+# process; the cached Samsung matcher compares it instead of second-resolution timestamps
+SAMSUNG_MODELS_REV_KEY = "samsung_models_rev"
 
 
 def create_tables():
     Base.metadata.create_all(bind=engine)
 
 
+# Bump whenever ensure_schema gains a new repair/migration step
+SCHEMA_VERSION = 5
+
+# Trigram FTS5 search indexes: (fts table, content table, indexed columns)
+FTS_INDEXES = (
+    ('parts_fts', 'parts', ('code', 'description')),
+    ('samsung_models_fts', 'samsung_models', ('model_code', 'model_name')),
+)
+
+# Unique indexes the Excel import script upserts ON CONFLICT against: (table, column, index).
+# Duplicate keys can block one; it is then retried on every startup (a PRAGMA per table
+# once it is in place) without rerunning the rest of ensure_schema.
+UNIQUE_INDEXES = (
+    ('parts', 'code', 'ix_parts_code'),
+    ('formulas', 'class_name', 'ix_formulas_class_name'),
+)
+
+
 def ensure_schema():
     """Ensure critical tables have required columns (repair if legacy tables exist)."""
     with engine.begin() as conn:
-        # Helper to fetch columns
+        # Skip the introspection when the database is already current; only a unique
+        # index that duplicate keys blocked last time is retried
+        try:
+            current = conn.exec_driver_sql("SELECT v FROM schema_version").scalar() == SCHEMA_VERSION
+        except Exception:
+            current = False  # no sentinel yet (new or legacy database)
+        if current:
+            for table, column, index in UNIQUE_INDEXES:
+                _ensure_unique_index(conn, table, column, index)
+            return
+
+        # Fetch the columns of every table we repair in one round-trip
+        table_cols = {}
+        try:
+            res = conn.exec_driver_sql("""
+                SELECT m.name, p.name FROM sqlite_master AS m
+                JOIN pragma_table_info(m.name) AS p
+                WHERE m.type = 'table' AND m.name IN ('parts', 'formulas', 'samsung_models', 'users')
+            """).all()
+            for table, col in res:
+                table_cols.setdefault(table, set()).add(col)
+        except Exception as e:
+            print(f"Warning: could not read table columns: {e}")
+
         def cols(table):
-            try:
-                res = conn.exec_driver_sql(f"PRAGMA table_info({table})").all()
-                return {row[1] for row in res}  # row[1] is 'name'
-            except Exception:
-                return set()
+            return table_cols.get(table, set())
         
         # Repair parts table if missing id
         pcols = cols('parts')
@@ -123,6 +209,7 @@ def ensure_schema():
                 )
             conn.exec_driver_sql("DROP TABLE parts")
             conn.exec_driver_sql("ALTER TABLE parts_new RENAME TO parts")
+
         
         # Repair formulas table if missing id
         fcols = cols('formulas')
@@ -171,8 +258,6 @@ def ensure_schema():
                 'dealer_labor_lvl3': "NUMERIC",
                 'dealer_margin': "NUMERIC",
             }
-            # Re-fetch after potential table creation
-            fcols = cols('formulas')
             for col_name, col_type in needed_cols.items():
                 if col_name not in fcols:
                     try:
@@ -180,6 +265,11 @@ def ensure_schema():
                     except Exception as e:
                         print(f"Warning: could not add column {col_name} to formulas: {e}")
 
+        # Part codes and formula class names should be unique (see UNIQUE_INDEXES)
+        for table, column, index in UNIQUE_INDEXES:
+            if cols(table):
+                _ensure_unique_index(conn, table, column, index)
+
         # Ensure samsung_models table exists (create if missing)
         sm_cols = cols('samsung_models')
         if not sm_cols:
@@ -205,6 +295,27 @@ def ensure_schema():
                 except Exception as e:
                     print(f"Warning: could not add model_code to samsung_models: {e}")
 
+        # model_code was added after the table existed, so create_all never indexed it;
+        # detection/device lookups and model searches filter on it
+        try:
+            conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_samsung_models_model_code ON samsung_models (model_code)")
+        except Exception as e:
+            print(f"Warning: could not create index on samsung_models.model_code: {e}")
+
+        # Revision counter for samsung_models (see SAMSUNG_MODELS_REV_KEY)
+        try:
+            conn.exec_driver_sql(
+                "INSERT OR IGNORE INTO app_meta (key, value) VALUES (?, '0')", (SAMSUNG_MODELS_REV_KEY,)
+            )
+            for trigger, op in (('ai', 'INSERT'), ('au', 'UPDATE'), ('ad', 'DELETE')):
+                conn.exec_driver_sql(f"""
+                    CREATE TRIGGER IF NOT EXISTS samsung_models_rev_{trigger} AFTER {op} ON samsung_models BEGIN
+                        UPDATE app_meta SET value = value + 1 WHERE key = '{SAMSUNG_MODELS_REV_KEY}';
+                    END
+                """)
+        except Exception as e:
+            print(f"Warning: could not create samsung_models revision triggers: {e}")
+
         # Ensure users table has role and permissions columns
         ucols = cols('users')
         if ucols:
@@ -225,6 +336,108 @@ def ensure_schema():
                 except Exception as e:
                     print(f"Warning: could not add created_by_id to users: {e}")
 
+        # Trigram FTS5 indexes for substring search: LIKE '%...%' would scan every row,
+        # these answer it from the index. External content (no copy of the text), kept
+        # in sync by triggers.
+        for fts, table, fts_cols in FTS_INDEXES:
+            try:
+                if not conn.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = ?", (fts,)).first():
+                    col_list = ", ".join(fts_cols)
+                    new_vals = ", ".join(f"new.{c}" for c in fts_cols)
+                    old_vals = ", ".join(f"old.{c}" for c in fts_cols)
+                    conn.exec_driver_sql(
+                        f"CREATE VIRTUAL TABLE {fts} USING fts5({col_list}, content='{table}', content_rowid='id', tokenize='trigram')"
+                    )
+                    conn.exec_driver_sql(f"""
+                        CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+                            INSERT INTO {fts} (rowid, {col_list}) VALUES (new.id, {new_vals});
+                        END
+                    """)
+                    conn.exec_driver_sql(f"""
+                        CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+                            INSERT INTO {fts} ({fts}, rowid, {col_list}) VALUES ('delete', old.id, {old_vals});
+                        END
+                    """)
+                    conn.exec_driver_sql(f"""
+                        CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {col_list} ON {table} BEGIN
+                            INSERT INTO {fts} ({fts}, rowid, {col_list}) VALUES ('delete', old.id, {old_vals});
+                            INSERT INTO {fts} (rowid, {col_list}) VALUES (new.id, {new_vals});
+                        END
+                    """)
+                    conn.exec_driver_sql(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+            except Exception as e:
+                print(f"Warning: could not create {fts} search index: {e}")
+
+        # Record the version so later startups can skip the checks above
+        conn.exec_driver_sql("CREATE TABLE IF NOT EXISTS schema_version (id INTEGER PRIMARY KEY CHECK (id = 1), v INTEGER NOT NULL)")
+        conn.exec_driver_sql(
+            "INSERT INTO schema_version (id, v) VALUES (1, ?) ON CONFLICT(id) DO UPDATE SET v = excluded.v",
+            (SCHEMA_VERSION,),
+        )
+
+
+# Duplicate keys listed in the startup warning before it is truncated
+DUPLICATE_KEYS_SHOWN = 20
+
+
+def _ensure_unique_index(conn, table: str, column: str, index: str) -> bool:
+    """Make index a UNIQUE index on table(column); True once it is in place.
+
+    Never deletes rows: if the column holds duplicate values the index is left as it is
+    and the conflicting values are reported, to be merged or renamed by an admin.
+    """
+    try:
+        indexes = {row[1]: row[2] for row in conn.exec_driver_sql(f"PRAGMA index_list({table})").all()}
+        if indexes.get(index):
+            return True
+        dupes = conn.exec_driver_sql(
+            f"SELECT {column}, COUNT(*) FROM {table} GROUP BY {column} HAVING COUNT(*) > 1 ORDER BY {column}"
+        ).all()
+        if dupes:
+            shown = ", ".join(f"{value!r} x{n}" for value, n in dupes[:DUPLICATE_KEYS_SHOWN])
+            more = f" (and {len(dupes) - DUPLICATE_KEYS_SHOWN} more)" if len(dupes) > DUPLICATE_KEYS_SHOWN else ""
+            print(
+                f"Warning: not creating unique index {index}: {len(dupes)} {table}.{column} values occur more "
+                f"than once: {shown}{more}. No rows were changed; merge or rename the duplicates and restart."
+            )
+            return False
+        if index in indexes:
+            conn.exec_driver_sql(f"DROP INDEX {index}")
+        conn.exec_driver_sql(f"CREATE UNIQUE INDEX {index} ON {table} ({column})")
+        return True
+    except Exception as e:
+        print(f"Warning: could not create unique index on {table}.{column}: {e}")
+        return False
+
+
+def has_unique_index(table: str, index: str) -> bool:
+    """Whether index exists on table as a UNIQUE index (ON CONFLICT upserts need one)"""
+    with engine.connect() as conn:
+        return any(row[1] == index and row[2] for row in conn.exec_driver_sql(f"PRAGMA index_list({table})").all())
+
+
+_initialized = False
+
+
+def init_db():
+    """create_tables() + ensure_schema(), run at most once per process (app startup, CLI scripts)"""
+    global _initialized
+    if _initialized:
+        return
+    create_tables()
+    ensure_schema()
+    _initialized = True
+
+
+def fts_indexes() -> frozenset:
+    """Names of the FTS_INDEXES tables that exist (SQLite built without FTS5 has none)"""
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN (%s)" % ", ".join("?" * len(FTS_INDEXES)),
+            tuple(fts for fts, _, _ in FTS_INDEXES),
+        ).scalars()
+        return frozenset(rows)
+
 
 def get_db():
     db = SessionLocal()
@@ -1,13 +1,259 @@
 import pandas as pd
+from datetime import date, datetime
+from itertools import islice
+from python_calamine import CalamineWorkbook
+from sqlalchemy import bindparam, case, func, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
-from database import engine, create_tables, Part, Formula, User, SessionLocal
-from passlib.context import CryptContext
+from auth import get_password_hash
+from database import engine, create_tables, has_unique_index, init_db, Part, Formula, User, SessionLocal
 import os
+import re
+from types import MappingProxyType
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+_WS = re.compile(r"\s+")
+_PUNCT = re.compile(r"[\\./-]+")
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+def _norm_col(c) -> str:
+    """Normalize a header: trim, lowercase, whitespace and ./\\- runs to underscores"""
+    return _PUNCT.sub("_", _WS.sub("_", str(c).strip().lower()))
+
+# Parts rows are parsed and upserted this many at a time, so memory stays flat for large sheets
+PARTS_CHUNK_ROWS = 10000
+
+# pandas' default NA strings plus the spreadsheet placeholders the importer always treated as empty
+NA_STRINGS = frozenset([
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+    "-", "—", "#REF!", "#NULL!",
+])
+
+def _cell(value):
+    """Convert a calamine cell the way pd.read_excel does (NA strings -> NaN, 3.0 -> 3)"""
+    if isinstance(value, str):
+        return float('nan') if value in NA_STRINGS else value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime(value.year, value.month, value.day)
+    return value
+
+def _header(row):
+    """Column labels for a header row: blanks become 'Unnamed: i', repeats get .1, .2 suffixes"""
+    labels, seen = [], {}
+    for i, value in enumerate(row):
+        label = str(_cell(value)) if value != "" else f"Unnamed: {i}"
+        if label in seen:
+            seen[label] += 1
+            label = f"{label}.{seen[label]}"
+        else:
+            seen[label] = 0
+        labels.append(label)
+    return labels
+
+def iter_sheet_chunks(sheet, chunk_rows: int = PARTS_CHUNK_ROWS):
+    """Yield a calamine sheet as DataFrames of at most chunk_rows rows (first non-blank row is the header)"""
+    rows = (row for row in sheet.iter_rows() if any(v != "" for v in row))
+    header = next(rows, None)
+    if header is None:
+        return
+    columns = _header(header)
+    while True:
+        chunk = [[_cell(v) for v in row] for row in islice(rows, chunk_rows)]
+        if not chunk:
+            return
+        yield pd.DataFrame(chunk, columns=columns)
+
+# Normalized header -> Part column; built once at import and shared read-only
+COLUMN_MAPPING = MappingProxyType({
+    'part_code': 'code',
+    'part_number': 'code',
+    'part_no': 'code',
+    'parts_no': 'code',
+    'p_no': 'code',
+    'p_no_': 'code',
+    'p_no__': 'code',
+    'item_code': 'code',
+    'material': 'code',
+    'material_code': 'code',
+    'code': 'code',
+    # New headers from provided Excel
+    'parts_code': 'code',
+    'parts_desc': 'description',
+    'mo_avg_price': 'map_price',
+    'mo_avg_amount': 'gr_usd',
+    # Existing variations
+    'desc': 'description',
+    'desc_': 'description',
+    'description': 'description',
+    'part_description': 'description',
+    'item_desc': 'description',
+    'name': 'description',
+    'map': 'map_price',
+    'map_price': 'map_price',
+    'status': 'status',
+    'n': 'net_price',
+    'net': 'net_price',
+    'net_price': 'net_price',
+    'diff': 'diff',
+    'diff_': 'diff',
+    's_qty': 'stock_qty',
+    's_qty_': 'stock_qty',
+    'stock_quantity': 'stock_qty',
+    'stock_qty': 'stock_qty',
+    # Warehouse/engineering stock columns (capture if main stock_qty missing)
+    'wh_stock_q': 'wh_stock_qty',
+    'wh_stock_qty': 'wh_stock_qty',
+    'eng_stock_q': 'eng_stock_qty',
+    'eng_stock_qty': 'eng_stock_qty',
+    'gr_qty': 'gr_qty',
+    'gr_$': 'gr_usd',
+    'gr_usd': 'gr_usd',
+})
+COLUMN_KEYS = frozenset(COLUMN_MAPPING)
+
+# Normalized header -> Formula column
+FORMULA_MAPPING = MappingProxyType({
+    'class': 'class_name',
+    'class_name': 'class_name',
+    'labor_1': 'labor_lvl1',
+    'labor_lvl1': 'labor_lvl1',
+    'labor_2': 'labor_lvl2',
+    'labor_lvl2': 'labor_lvl2',
+    'labor_3': 'labor_lvl3',
+    'labor_lvl3': 'labor_lvl3',
+    'labor_lvl2_major': 'labor_lvl2_major',
+    'labor_lvl2_minor': 'labor_lvl2_minor',
+    'major': 'labor_lvl2_major',
+    'minor': 'labor_lvl2_minor',
+    'margin': 'margin',
+    'total_map': 'total_map',
+    'exchange': 'exchange_rate',
+    'exchange_rate': 'exchange_rate',
+    'final': 'final_price',
+    'final_price': 'final_price',
+})
+FORMULA_KEYS = frozenset(FORMULA_MAPPING)
+
+def parts_upsert_statement(columns):
+    """
+    Build a single INSERT ... ON CONFLICT(code) DO UPDATE for the given part columns.
+    Incoming NULLs never overwrite stored values, and an existing non-empty
+    description is kept (only empty/null descriptions are filled in).
+    """
+    stmt = sqlite_insert(Part.__table__)
+    excluded = stmt.excluded
+    set_ = _parts_set(columns, lambda c: excluded[c])
+    set_['updated_at'] = excluded.updated_at
+    return stmt.on_conflict_do_update(index_elements=['code'], set_=set_)
+
+def parts_update_statement(columns):
+    """
+    UPDATE ... WHERE code = :b_code with the same merge rules as parts_upsert_statement,
+    for databases where parts.code is not unique yet and ON CONFLICT cannot be used.
+    Parameters are the record's keys prefixed with 'b_'.
+    """
+    table = Part.__table__
+    return (
+        update(table)
+        .where(table.c.code == bindparam('b_code'))
+        .values(**_parts_set(columns, lambda c: bindparam(f'b_{c}')), updated_at=func.current_timestamp())
+    )
+
+def _parts_set(columns, incoming):
+    """SET clause for merging incoming part values (incoming(col) -> SQL expression)"""
+    table = Part.__table__
+    set_ = {
+        c: func.coalesce(incoming(c), table.c[c])
+        for c in columns if c not in ('code', 'description')
+    }
+    if 'description' in columns:
+        set_['description'] = case(
+            (func.coalesce(func.trim(table.c.description), '') == '',
+             func.coalesce(incoming('description'), table.c.description)),
+            else_=table.c.description,
+        )
+    return set_
+
+def upsert_row_by_row(session: Session, table, update_stmt, records):
+    """Fallback upsert without a unique key: UPDATE each record, INSERT it when no row matched"""
+    insert_stmt = table.insert()
+    for record in records:
+        if session.execute(update_stmt, {f'b_{k}': v for k, v in record.items()}).rowcount == 0:
+            session.execute(insert_stmt, record)
+
+def formulas_upsert_statement(columns):
+    """INSERT ... ON CONFLICT(class_name) DO UPDATE; incoming NULLs keep the stored values."""
+    table = Formula.__table__
+    stmt = sqlite_insert(table)
+    excluded = stmt.excluded
+    set_ = {c: func.coalesce(excluded[c], table.c[c]) for c in columns if c != 'class_name'}
+    set_['updated_at'] = excluded.updated_at
+    return stmt.on_conflict_do_update(index_elements=['class_name'], set_=set_)
+
+def formulas_update_statement(columns):
+    """UPDATE ... WHERE class_name = :b_class_name, the no-unique-index twin of formulas_upsert_statement"""
+    table = Formula.__table__
+    return (
+        update(table)
+        .where(table.c.class_name == bindparam('b_class_name'))
+        .values(
+            **{c: func.coalesce(bindparam(f'b_{c}'), table.c[c]) for c in columns if c != 'class_name'},
+            updated_at=func.current_timestamp(),
+        )
+    )
+
+def clean_parts_frame(parts_df: pd.DataFrame) -> pd.DataFrame:
+    """Normalize/rename a chunk of Parts rows into Part columns, with missing values as None"""
+    # Clean column names (normalize whitespace and punctuation)
+    parts_df.columns = parts_df.columns.map(_norm_col)
+
+    # Map common column variations
+    rename_dict = {c: COLUMN_MAPPING[c] for c in COLUMN_KEYS.intersection(parts_df.columns)}
+    parts_df = parts_df.rename(columns=rename_dict)
+
+    # Heuristic fallback if 'code' is still missing: pick a likely column
+    if 'code' not in parts_df.columns:
+        candidates = [
+            c for c in parts_df.columns
+            if (
+                'code' in c or c in ['p_no', 'p_no_', 'p_no__', 'material', 'material_code', 'item_code', 'part', 'parts']
+            ) and 'desc' not in c and 'description' not in c
+        ]
+        if candidates:
+            parts_df = parts_df.rename(columns={candidates[0]: 'code'})
+
+    # If stock_qty not present, try to build it from warehouse/engineering stock columns
+    if 'stock_qty' not in parts_df.columns:
+        for aux_col in ['wh_stock_qty', 'eng_stock_qty']:
+            if aux_col in parts_df.columns:
+                parts_df[aux_col] = pd.to_numeric(parts_df[aux_col], errors='coerce')
+        qty_cols = [c for c in ['stock_qty', 'wh_stock_qty', 'eng_stock_qty'] if c in parts_df.columns]
+        if qty_cols:
+            parts_df['stock_qty'] = parts_df[qty_cols].sum(axis=1, min_count=1)
+
+    keep_cols = ['code','description','map_price','status','net_price','diff','stock_qty','gr_qty','gr_usd']
+    parts_df = parts_df[[c for c in keep_cols if c in parts_df.columns]]
+
+    # Clean text / defaults
+    if 'code' in parts_df.columns:
+        parts_df['code'] = parts_df['code'].astype(str).str.strip()
+        # Drop obvious empty codes
+        # astype(str) keeps NaN on pandas' string dtype, so test for it explicitly
+        parts_df = parts_df[parts_df['code'].notna() & parts_df['code'].ne('')]
+        parts_df = parts_df[parts_df['code'].str.lower() != 'nan']
+    if 'description' in parts_df.columns:
+        parts_df['description'] = parts_df['description'].astype(str).str.strip().str.rstrip(';')
+    if 'status' in parts_df.columns:
+        parts_df['status'] = parts_df['status'].fillna('Active')
+
+    # Coerce numerics (one apply over all present numeric columns)
+    numeric_cols = [c for c in ['map_price','net_price','diff','stock_qty','gr_qty','gr_usd'] if c in parts_df.columns]
+    if numeric_cols:
+        parts_df[numeric_cols] = parts_df[numeric_cols].apply(pd.to_numeric, errors='coerce')
+
+    parts_df = parts_df.where(pd.notnull(parts_df), None)
+    return parts_df
 
 def import_excel_to_database(excel_file_path: str):
     """
@@ -20,148 +266,40 @@ def import_excel_to_database(excel_file_path: str):
     The description is only set if the existing value is empty or null.
     """
     print("Creating database tables...")
-    create_tables()
+    init_db()
 
     print(f"Reading Excel file: {excel_file_path}")
 
     try:
-        xls = pd.ExcelFile(excel_file_path)
+        if not os.path.isfile(excel_file_path):
+            raise FileNotFoundError(excel_file_path)
+        # Rust-backed calamine parser; the Parts sheet is streamed row by row below
+        workbook = CalamineWorkbook.from_path(excel_file_path)
+        sheet_names = workbook.sheet_names
         # Read parts data (prefer 'Parts' sheet else first sheet)
-        sheet_name = 'Parts' if 'Parts' in xls.sheet_names else 0
-        parts_df = pd.read_excel(
-            excel_file_path,
-            sheet_name=sheet_name,
-            na_values=["#N/A", "N/A", "NA", "-", "—", "#REF!", "#NULL!"],
-            keep_default_na=True
-        )
-        print(f"Found {len(parts_df)} parts to import")
-
-        # Clean column names (normalize whitespace and punctuation)
-        parts_df.columns = (
-            parts_df.columns
-                .str.strip()
-                .str.lower()
-                .str.replace(r"\s+", "_", regex=True)
-                .str.replace(r"[\\./-]+", "_", regex=True)
-        )
+        if 'Parts' in sheet_names:
+            parts_sheet = workbook.get_sheet_by_name('Parts')
+        else:
+            parts_sheet = workbook.get_sheet_by_index(0)
 
-        # Map common column variations
-        column_mapping = {
-            'part_code': 'code',
-            'part_number': 'code',
-            'part_no': 'code',
-            'parts_no': 'code',
-            'p_no': 'code',
-            'p_no_': 'code',
-            'p_no__': 'code',
-            'item_code': 'code',
-            'material': 'code',
-            'material_code': 'code',
-            'code': 'code',
-            # New headers from provided Excel
-            'parts_code': 'code',
-            'parts_desc': 'description',
-            'mo_avg_price': 'map_price',
-            'mo_avg_amount': 'gr_usd',
-            # Existing variations
-            'desc': 'description',
-            'desc_': 'description',
-            'description': 'description',
-            'part_description': 'description',
-            'item_desc': 'description',
-            'name': 'description',
-            'map': 'map_price',
-            'map_price': 'map_price',
-            'status': 'status',
-            'n': 'net_price',
-            'net': 'net_price',
-            'net_price': 'net_price',
-            'diff': 'diff',
-            'diff_': 'diff',
-            's_qty': 'stock_qty',
-            's_qty_': 'stock_qty',
-            'stock_quantity': 'stock_qty',
-            'stock_qty': 'stock_qty',
-            # Warehouse/engineering stock columns (capture if main stock_qty missing)
-            'wh_stock_q': 'wh_stock_qty',
-            'wh_stock_qty': 'wh_stock_qty',
-            'eng_stock_q': 'eng_stock_qty',
-            'eng_stock_qty': 'eng_stock_qty',
-            'gr_qty': 'gr_qty',
-            'gr_$': 'gr_usd',
-            'gr_usd': 'gr_usd'
-        }
-        rename_dict = {c: column_mapping[c] for c in parts_df.columns if c in column_mapping}
-        parts_df = parts_df.rename(columns=rename_dict)
-
-        # Heuristic fallback if 'code' is still missing: pick a likely column
-        if 'code' not in parts_df.columns:
-            candidates = [
-                c for c in parts_df.columns
-                if (
-                    'code' in c or c in ['p_no', 'p_no_', 'p_no__', 'material', 'material_code', 'item_code', 'part', 'parts']
-                ) and 'desc' not in c and 'description' not in c
-            ]
-            if candidates:
-                parts_df = parts_df.rename(columns={candidates[0]: 'code'})
-
-        # If stock_qty not present, try to build it from warehouse/engineering stock columns
-        if 'stock_qty' not in parts_df.columns:
-            for aux_col in ['wh_stock_qty', 'eng_stock_qty']:
-                if aux_col in parts_df.columns:
-                    parts_df[aux_col] = pd.to_numeric(parts_df[aux_col], errors='coerce')
-            qty_cols = [c for c in ['stock_qty', 'wh_stock_qty', 'eng_stock_qty'] if c in parts_df.columns]
-            if qty_cols:
-                parts_df['stock_qty'] = parts_df[qty_cols].sum(axis=1, min_count=1)
-
-        keep_cols = ['code','description','map_price','status','net_price','diff','stock_qty','gr_qty','gr_usd']
-        parts_df = parts_df[[c for c in keep_cols if c in parts_df.columns]]
-
-        # Clean text / defaults
-        if 'code' in parts_df.columns:
-            parts_df['code'] = parts_df['code'].astype(str).str.strip()
-            # Drop obvious empty codes
-            parts_df = parts_df[parts_df['code'].str.len() > 0]
-            parts_df = parts_df[parts_df['code'].str.lower() != 'nan']
-        if 'description' in parts_df.columns:
-            parts_df['description'] = parts_df['description'].astype(str).str.strip().str.replace(r';+$','', regex=True)
-        if 'status' in parts_df.columns:
-            parts_df['status'] = parts_df['status'].fillna('Active')
-
-        # Coerce numerics
-        for num_col in ['map_price','net_price','diff','stock_qty','gr_qty','gr_usd']:
-            if num_col in parts_df.columns:
-                parts_df[num_col] = pd.to_numeric(parts_df[num_col], errors='coerce')
-
-        parts_df = parts_df.where(pd.notnull(parts_df), None)
-
-        # Upsert via ORM (preserve table schema, incl. id)
+        # Upsert each chunk with one bulk statement keyed by code (preserve table schema, incl. id)
         print("Importing parts data (upsert by code)...")
+        imported = 0
+        # ON CONFLICT(code) needs the unique index, which ensure_schema leaves out while
+        # duplicate codes exist; fall back to a per-row update-or-insert then
+        parts_code_unique = has_unique_index('parts', 'ix_parts_code')
+        if not parts_code_unique:
+            print("parts.code is not unique in this database; importing row by row (slower)")
         session: Session = SessionLocal()
         try:
-            imported = 0
-            for _, row in parts_df.iterrows():
-                code = row.get('code')
-                if not code:
-                    continue
-                existing = session.query(Part).filter(Part.code == code).first()
-                fields = {k: row.get(k) for k in keep_cols if k in parts_df.columns}
-                if existing:
-                    for k, v in fields.items():
-                        if k != 'code' and v is not None:
-                            if k == 'description':
-                                # Do not overwrite an existing non-empty description
-                                current_desc = getattr(existing, 'description', None)
-                                if current_desc is None or str(current_desc).strip() == '':
-                                    setattr(existing, 'description', v)
-                                else:
-                                    # Keep existing description
-                                    pass
-                            else:
-                                setattr(existing, k, v)
-                else:
-                    session.add(Part(**fields))
-                imported += 1
+            for chunk in iter_sheet_chunks(parts_sheet):
+                parts_df = clean_parts_frame(chunk)
+                records = [r for r in parts_df.to_dict(orient="records") if r.get('code')]
+                if records and parts_code_unique:
+                    session.execute(parts_upsert_statement(list(parts_df.columns)), records)
+                elif records:
+                    upsert_row_by_row(session, Part.__table__, parts_update_statement(list(parts_df.columns)), records)
+                imported += len(records)
             session.commit()
             print(f"Imported/updated {imported} parts")
         finally:
@@ -169,57 +307,31 @@ def import_excel_to_database(excel_file_path: str):
 
         # Read formulas data if available
         try:
-            if 'Formulas' in xls.sheet_names:
-                formulas_df = pd.read_excel(excel_file_path, sheet_name='Formulas')
-                formulas_df.columns = formulas_df.columns.str.strip().str.lower().str.replace(r"\s+", "_", regex=True).str.replace(r"[\\./-]+", "_", regex=True)
-                formula_mapping = {
-                    'class': 'class_name',
-                    'class_name': 'class_name',
-                    'labor_1': 'labor_lvl1',
-                    'labor_lvl1': 'labor_lvl1',
-                    'labor_2': 'labor_lvl2',
-                    'labor_lvl2': 'labor_lvl2',
-                    'labor_3': 'labor_lvl3',
-                    'labor_lvl3': 'labor_lvl3',
-                    'labor_lvl2_major': 'labor_lvl2_major',
-                    'labor_lvl2_minor': 'labor_lvl2_minor',
-                    'major': 'labor_lvl2_major',
-                    'minor': 'labor_lvl2_minor',
-                    'margin': 'margin',
-                    'total_map': 'total_map',
-                    'exchange': 'exchange_rate',
-                    'exchange_rate': 'exchange_rate',
-                    'final': 'final_price',
-                    'final_price': 'final_price'
-                }
-                formulas_df = formulas_df.rename(columns={c: formula_mapping[c] for c in formulas_df.columns if c in formula_mapping})
-                for c in ['labor_lvl1','labor_lvl2','labor_lvl3','labor_lvl2_major','labor_lvl2_minor','exchange_rate','final_price','margin','total_map']:
-                    if c in formulas_df.columns:
-                        formulas_df[c] = pd.to_numeric(formulas_df[c], errors='coerce')
+            if 'Formulas' in sheet_names:
+                formulas_df = pd.read_excel(excel_file_path, sheet_name='Formulas', engine="calamine")
+                formulas_df.columns = formulas_df.columns.map(_norm_col)
+                formulas_df = formulas_df.rename(columns={c: FORMULA_MAPPING[c] for c in FORMULA_KEYS.intersection(formulas_df.columns)})
+                numeric_cols = [c for c in ['labor_lvl1','labor_lvl2','labor_lvl3','labor_lvl2_major','labor_lvl2_minor','exchange_rate','final_price','margin','total_map'] if c in formulas_df.columns]
+                if numeric_cols:
+                    formulas_df[numeric_cols] = formulas_df[numeric_cols].apply(pd.to_numeric, errors='coerce')
                 # Normalize margin: if <= 1, treat as fraction and convert to percent value
                 if 'margin' in formulas_df.columns:
-                    formulas_df['margin'] = formulas_df['margin'].apply(lambda x: (x * 100.0) if pd.notnull(x) and x <= 1 else x)
+                    margin = formulas_df['margin']
+                    mask = margin.notna() & (margin <= 1)
+                    formulas_df.loc[mask, 'margin'] = margin[mask] * 100.0
+                payload_keys = ['class_name','labor_lvl1','labor_lvl2','labor_lvl3','labor_lvl2_major','labor_lvl2_minor','margin','total_map','exchange_rate','final_price']
+                formulas_df = formulas_df[[k for k in payload_keys if k in formulas_df.columns]]
                 formulas_df = formulas_df.where(pd.notnull(formulas_df), None)
 
                 session = SessionLocal()
                 try:
-                    fimps = 0
-                    for _, row in formulas_df.iterrows():
-                        cls = row.get('class_name')
-                        if not cls:
-                            continue
-                        existing = session.query(Formula).filter(Formula.class_name == cls).first()
-                        payload_keys = ['class_name','labor_lvl1','labor_lvl2','labor_lvl3','labor_lvl2_major','labor_lvl2_minor','margin','total_map','exchange_rate','final_price']
-                        payload = {k: row.get(k) for k in payload_keys if k in formulas_df.columns}
-                        if existing:
-                            for k, v in payload.items():
-                                if k != 'class_name' and v is not None:
-                                    setattr(existing, k, v)
-                        else:
-                            session.add(Formula(**payload))
-                        fimps += 1
+                    records = [r for r in formulas_df.to_dict(orient="records") if r.get('class_name')]
+                    if records and has_unique_index('formulas', 'ix_formulas_class_name'):
+                        session.execute(formulas_upsert_statement(list(formulas_df.columns)), records)
+                    elif records:
+                        upsert_row_by_row(session, Formula.__table__, formulas_update_statement(list(formulas_df.columns)), records)
                     session.commit()
-                    print(f"Imported/updated {fimps} formulas")
+                    print(f"Imported/updated {len(records)} formulas")
                 finally:
                     session.close()
         except Exception as e:
@@ -231,7 +343,7 @@ def import_excel_to_database(excel_file_path: str):
         try:
             existing_user = session.query(User).filter(User.username == "admin").first()
             if not existing_user:
-                session.add(User(username="admin", password=hash_password("admin123"), is_active="Active"))
+                session.add(User(username="admin", password=get_password_hash("admin123"), is_active="Active"))
                 session.commit()
                 print("Created admin user (username: admin, password: admin123)")
             else:
@@ -284,7 +396,7 @@ def create_sample_data():
 
         # Ensure admin user
         if not session.query(User).filter(User.username == "admin").first():
-            session.add(User(username="admin", password=hash_password("admin123"), is_active="Active"))
+            session.add(User(username="admin", password=get_password_hash("admin123"), is_active="Active"))
 
         session.commit()
         print("✅ Sample data created successfully!")
@@ -1,15 +1,23 @@
 from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Query
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload, raiseload
 from typing import List, Optional
+from functools import lru_cache
 from contextlib import asynccontextmanager
 import re
-import io
 import pandas as pd
 import os
+import threading
+import orjson
+from cachetools import TTLCache
 
-from database import get_db, create_tables, Part as PartModel, Formula as FormulaModel, User as UserModel, ensure_schema, SamsungModel as SamsungModelORM, engine
+from samsung_matcher import SamsungMatch, SamsungMatcher
+from database import get_db, init_db, Part as PartModel, Formula as FormulaModel, User as UserModel, fts_indexes, SamsungModel as SamsungModelORM, engine
+from database import AppMeta, SAMSUNG_MODELS_REV_KEY
 from models import (
     Part, PartCreate, PartUpdate, PartSearch,
     Formula, FormulaCreate, FormulaUpdate,
@@ -19,25 +27,67 @@ from models import (
     UserUpdate
 )
 from auth import authenticate_user, create_access_token, get_current_user, get_password_hash
-from auth import get_current_admin_user
-from sqlalchemy import or_
+from auth import get_current_admin_user, normalize_role, user_is_admin, AuthMiddleware, invalidate_user_cache
+from sqlalchemy import Integer, column, func, or_, select, update, text as sql_text
+
+
+JSON_STREAM_BATCH = 256
+
+
+async def _json_array_stream(items):
+    """Encode an iterable of dicts as a JSON array, yielding a chunk every JSON_STREAM_BATCH items.
+
+    Used instead of response_model on list endpoints whose handlers already build the
+    response dicts. DECIMAL columns come back as Decimal, which orjson hands to float()
+    like the float fields of the Pydantic models would.
+    """
+    sep = b"["
+    buf = []
+    for item in items:
+        buf.append(sep)
+        buf.append(orjson.dumps(item, default=float))
+        sep = b","
+        if len(buf) >= 2 * JSON_STREAM_BATCH:
+            yield b"".join(buf)
+            buf.clear()
+    buf.append(b"]" if sep == b"," else b"[]")
+    yield b"".join(buf)
+
 
 # Helper: infer Samsung category directly from arbitrary text/code based on user's rules
 # Returns one of: 'highend', 'midend', 'lowend', 'wearable', 'tab', or None
 _DEF_SERIES_RE = re.compile(r"\b(?:GALAXY\s*)?(S\d{1,2}|NOTE\s*\d{1,2}|Z\s*(?:FOLD|FLIP)\b)", re.IGNORECASE)
+_SM_TAB_RE = re.compile(r"\bSM-(?:T|X)\w+", re.IGNORECASE)
+_SM_WEARABLE_RE = re.compile(r"\bSM-(?:R|L)\w+", re.IGNORECASE)
+_SM_HIGHEND_RE = re.compile(r"\bSM-(?:S9|S92|F9|N9)\w*", re.IGNORECASE)
+_A_SERIES_RE = re.compile(r"\bA(\d{1,2})\b", re.IGNORECASE)
+_MF_SERIES_RE = re.compile(r"\b(?:M\d{1,2}|F\d{1,2})\b", re.IGNORECASE)
+
+# Part search term derivation (/parts, /parts/count, /parts/device-options)
+_DIGITS_RE = re.compile(r"\d{3,4}")
+_NON_ALNUM_RE = re.compile(r"[^A-Za-z0-9]+")
+_LEAD_TAIL_RE = re.compile(r"([A-Za-z])(\d{3,4})")
+
+# Excel upload cleanup
+_TRAIL_SEMI_RE = re.compile(r";+$")
+# Excel header normalization: whitespace runs and separator runs both become '_'
+_HEADER_WS_RE = re.compile(r"\s+")
+_HEADER_SEP_RE = re.compile(r"[\\./-]+")
+_DESC_PLACEHOLDERS = ('nan', 'none', '-', '--', 'n/a', '#n/a')
 
 
 # --- Permissions helpers ---
 
-def _parse_permissions(csv: Optional[str]) -> set:
+@lru_cache(maxsize=4096)
+def _parse_permissions(csv: Optional[str]) -> frozenset:
+    # Cached per distinct CSV: a user's permissions string rarely changes between requests
     if not csv:
-        return set()
-    return {p.strip() for p in str(csv).split(',') if p and str(p).strip()}
+        return frozenset()
+    return frozenset(p.strip() for p in str(csv).split(',') if p and str(p).strip())
 
 
 def require_permission(current_user: UserModel, perm: str):
-    role = getattr(current_user, 'role', None)
-    if str(role or '').lower() == 'admin':
+    if user_is_admin(current_user):
         return
     perms = _parse_permissions(getattr(current_user, 'permissions', None))
     if perm not in perms:
@@ -50,9 +100,11 @@ def _norm(s: Optional[str]) -> str:
 
 # --- Samsung categorization helpers (fix missing definitions) ---
 
+@lru_cache(maxsize=4096)
 def categorize_samsung_text(text: Optional[str]) -> Optional[str]:
     """Heuristically categorize Samsung device family from arbitrary text/code.
     Returns: 'highend' | 'midend' | 'lowend' | 'wearable' | 'tab' | None
+    Pure function of its input, memoized since the same parts recur across pages.
     """
     t = (text or "").strip()
     if not t:
@@ -61,19 +113,19 @@ def categorize_samsung_text(text: Optional[str]) -> Optional[str]:
     tn = _norm(t)
 
     # Tablets
-    if any(k in tl for k in ["galaxy tab", "tab s", "tab a", "tab active"]) or re.search(r"\bSM-(?:T|X)\w+", t, re.I):
+    if any(k in tl for k in ["galaxy tab", "tab s", "tab a", "tab active"]) or _SM_TAB_RE.search(t):
         return "tab"
 
     # Wearables: watches/buds
-    if any(k in tl for k in ["galaxy watch", "gear s", "buds"]) or re.search(r"\bSM-(?:R|L)\w+", t, re.I):
+    if any(k in tl for k in ["galaxy watch", "gear s", "buds"]) or _SM_WEARABLE_RE.search(t):
         return "wearable"
 
     # High-end: S/Note/Z series
-    if _DEF_SERIES_RE.search(t) or re.search(r"\bSM-(?:S9|S92|F9|N9)\w*", t, re.I):
+    if _DEF_SERIES_RE.search(t) or _SM_HIGHEND_RE.search(t):
         return "highend"
 
     # A-series split: A0-A2 low, A3-A9 mid
-    m = re.search(r"\bA(\d{1,2})\b", tn, re.I)
+    m = _A_SERIES_RE.search(tn)
     if m:
         try:
             num = int(m.group(1))
@@ -82,7 +134,7 @@ def categorize_samsung_text(text: Optional[str]) -> Optional[str]:
             pass
 
     # M / F series usually budget
-    if re.search(r"\b(?:M\d{1,2}|F\d{1,2})\b", tn, re.I) or any(k in tl for k in ["xcover", "core"]):
+    if _MF_SERIES_RE.search(tn) or any(k in tl for k in ["xcover", "core"]):
         return "lowend"
 
     return None
@@ -109,11 +161,123 @@ def reconcile_category(inferred: Optional[str], matched: Optional[str]) -> Optio
     return matched or inferred
 
 
+# --- Samsung detection (shared by /parts, /parts/{id}, /parts/device-options, /detect-samsung) ---
+
+# Rebuilt only when the samsung_models fingerprint changes or a Samsung endpoint invalidates it
+_samsung_cache = (None, None)  # (fingerprint, SamsungMatcher)
+_samsung_cache_lock = threading.Lock()
+
+# The revision counter catches every write; max(updated_at)/count only have one-second
+# resolution and remain as a fallback for databases without the revision triggers
+_SAMSUNG_FINGERPRINT = select(
+    select(AppMeta.value).where(AppMeta.key == SAMSUNG_MODELS_REV_KEY).scalar_subquery(),
+    func.max(SamsungModelORM.updated_at),
+    func.count(SamsungModelORM.id),
+)
+
+
+def invalidate_samsung_index() -> None:
+    global _samsung_cache
+    _samsung_cache = (None, None)
+    # Device filters resolve through the matcher, so cached device counts are stale too
+    invalidate_parts_count()
+
+
+def _get_samsung_matcher(db: Session) -> SamsungMatcher:
+    """Return the cached Samsung matcher, rebuilding it if the table changed"""
+    global _samsung_cache
+    ver = tuple(db.execute(_SAMSUNG_FINGERPRINT).one())
+    cached_ver, matcher = _samsung_cache
+    if cached_ver == ver:
+        return matcher
+    with _samsung_cache_lock:
+        cached_ver, matcher = _samsung_cache
+        if cached_ver != ver:
+            rows = db.execute(
+                select(SamsungModelORM.model_name, SamsungModelORM.model_code, SamsungModelORM.category).order_by(SamsungModelORM.id)
+            ).all()
+            matcher = SamsungMatcher([SamsungMatch(*r) for r in rows])
+            _samsung_cache = (ver, matcher)
+    return matcher
+
+
+# FTS5 trigram indexes known to exist, set at startup
+_fts_indexes = frozenset()
+
+
+def _keyset_page(query, id_col, skip: int, limit: int, after_id: Optional[int]):
+    """One page of query in id order: seeks past after_id when given, else falls back to OFFSET skip"""
+    query = query.order_by(id_col).limit(limit)
+    if after_id is not None:
+        return query.where(id_col > after_id)
+    return query.offset(skip)
+
+
+def _contains_any(terms):
+    """Parts whose code or description contains any of terms, case-insensitively.
+
+    Answered from the parts_fts trigram index when possible. Trigram phrases need at
+    least 3 characters, and LIKE wildcards in a term have no FTS equivalent, so such
+    term sets keep the plain ILIKE scan.
+    """
+    return _fts_contains_any(PartModel, 'parts_fts', (PartModel.code, PartModel.description), terms)
+
+
+def _fts_contains_any(orm, fts: str, cols, terms):
+    """Rows of orm whose cols contain any of terms, via the fts trigram index when it can answer"""
+    if fts in _fts_indexes and all(len(t) >= 3 and '%' not in t and '_' not in t for t in terms):
+        match = " OR ".join('"' + t.replace('"', '""') + '"' for t in terms)
+        rowids = sql_text(f"SELECT rowid FROM {fts} WHERE {fts} MATCH :match").bindparams(match=match)
+        return orm.id.in_(rowids.columns(column("rowid", Integer)))
+    return or_(*[c.ilike(f"%{t}%") for t in terms for c in cols])
+
+
+@lru_cache(maxsize=1024)
+def _search_terms(s: str) -> tuple:
+    """Substrings a free-text part search matches on (memoized: typeahead repeats terms)"""
+    # Direct case-insensitive match on code/description
+    terms = [s]
+    # Normalized variant without punctuation, uppercased
+    s_norm = _NON_ALNUM_RE.sub("", s).upper()
+    if s_norm and s_norm != s:
+        terms.append(s_norm)
+    # Numeric-tail fallback: for queries like 's928' also match '928'
+    terms.extend(m.group(0) for m in _DIGITS_RE.finditer(s))
+    # Also try lead-letter + tail pattern (e.g., S928)
+    lm = _LEAD_TAIL_RE.search(s_norm or s)
+    if lm:
+        terms.append(f"{lm.group(1).upper()}{lm.group(2)}")
+    return tuple(terms)
+
+
+def _parts_conditions(search, status, min_price, max_price, in_stock, device, matcher) -> list:
+    """WHERE predicates shared by /parts/ and /parts/count; matcher is only read when device is set"""
+    conds = []
+    if search:
+        conds.append(_contains_any(_search_terms(search.strip())))
+    if status:
+        conds.append(PartModel.status == status)
+    if min_price is not None:
+        conds.append(PartModel.map_price >= min_price)
+    if max_price is not None:
+        conds.append(PartModel.map_price <= max_price)
+    if in_stock is not None:
+        conds.append(PartModel.stock_qty > 0 if in_stock else PartModel.stock_qty == 0)
+    # Device filtering: translate the device key to SQL patterns (from the cached
+    # Samsung index) to narrow the result set before enrichment
+    if device:
+        patterns = matcher.device_patterns(device)
+        if patterns:
+            conds.append(_contains_any(sorted(patterns)))
+    return conds
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    create_tables()
-    ensure_schema()
+    global _fts_indexes
+    init_db()
+    _fts_indexes = fts_indexes()
     # Seed default admin if configured via environment (no hardcoded demo credentials)
     from sqlalchemy.orm import sessionmaker
     SessionLocal = sessionmaker(bind=engine) if 'engine' in globals() else None
@@ -135,13 +299,28 @@ async def lifespan(app: FastAPI):
                         permissions=','.join(sorted(required))
                     ))
                     db.commit()
+                elif os.getenv('ADMIN_RESET_PERMS') == '1':
+                    # Reset to exactly the required set: one idempotent UPDATE, no read-modify-write
+                    perms = ','.join(sorted(required))
+                    db.execute(
+                        update(UserModel)
+                        .where(
+                            UserModel.id == admin_user.id,
+                            or_(
+                                UserModel.permissions.is_distinct_from(perms),
+                                UserModel.role.is_distinct_from('admin'),
+                                UserModel.is_active.is_distinct_from('Active'),
+                            ),
+                        )
+                        .values(permissions=perms, role='admin', is_active='Active')
+                    )
+                    db.commit()
                 else:
                     changed = False
                     if str(getattr(admin_user, 'role', None) or '').lower() != 'admin':
                         admin_user.role = 'admin'
                         changed = True
-                    perms = set((admin_user.permissions or '').split(','))
-                    merged = ','.join(sorted(p.strip() for p in (perms | required) if p.strip()))
+                    merged = ','.join(sorted(_parse_permissions(admin_user.permissions) | required))
                     if admin_user.permissions != merged:
                         admin_user.permissions = merged
                         changed = True
@@ -172,6 +351,9 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+# Resolve bearer tokens to users once per request (added first so CORS stays outermost)
+app.add_middleware(AuthMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -187,14 +369,14 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 # Authentication endpoints
 @app.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(data={"sub": user.username})
+    access_token = create_access_token(data={"sub": user.username, "role": normalize_role(user.role)})
     return {"access_token": access_token, "token_type": "bearer"}
 
 # New: get current user profile
@@ -203,26 +385,24 @@ async def get_me(current_user: User = Depends(get_current_user)):
     return current_user
 
 # Admin-only: list users
-@app.get("/admin/users", response_model=List[User])
+@app.get("/admin/users", responses={200: {"model": List[User]}})
 async def list_users(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     require_permission(current_user, 'manage_users')
-    users = db.query(UserModel).all()
-    id_to_username = {u.id: u.username for u in users}
+    # Creators come back in the same SELECT (LEFT OUTER JOIN users); any other
+    # relationship touched in the loop below raises instead of lazy-loading per row
+    users = db.query(UserModel).options(joinedload(UserModel.created_by), raiseload('*')).all()
     # Project ORM objects to dicts that include creator info for API response
-    result = []
-    for u in users:
-        cid = getattr(u, 'created_by_id', None)
-        result.append({
-            'id': u.id,
-            'username': u.username,
-            'is_active': u.is_active,
-            'role': getattr(u, 'role', None),
-            'permissions': getattr(u, 'permissions', None),
-            'created_at': u.created_at,
-            'created_by_id': cid,
-            'created_by_username': id_to_username.get(cid)
-        })
-    return result
+    result = ({
+        'id': u.id,
+        'username': u.username,
+        'is_active': u.is_active,
+        'role': getattr(u, 'role', None),
+        'permissions': getattr(u, 'permissions', None),
+        'created_at': u.created_at,
+        'created_by_id': getattr(u, 'created_by_id', None),
+        'created_by_username': u.created_by.username if u.created_by else None
+    } for u in users)
+    return StreamingResponse(_json_array_stream(result), media_type="application/json")
 
 # Admin-only: create user (with optional role/permissions)
 @app.post("/admin/users", response_model=User)
@@ -254,6 +434,7 @@ async def admin_update_user(user_id: int, updates: UserUpdate, db: Session = Dep
     for k, v in data.items():
         setattr(user, k, v)
     db.commit()
+    invalidate_user_cache(user_id)
     db.refresh(user)
     return user
 
@@ -266,6 +447,7 @@ async def admin_delete_user(user_id: int, db: Session = Depends(get_db), current
         raise HTTPException(status_code=404, detail="User not found")
     db.delete(user)
     db.commit()
+    invalidate_user_cache(user_id)
     return None
 
 # Keep legacy basic user creation but restrict to admins only now
@@ -284,7 +466,7 @@ async def create_user(user: UserCreate, db: Session = Depends(get_db), current_u
     return db_user
 
 # Parts endpoints
-@app.get("/parts/", response_model=List[Part])
+@app.get("/parts/", responses={200: {"model": List[Part]}})
 async def get_parts(
     skip: int = 0,
     limit: int = 100,
@@ -294,241 +476,62 @@ async def get_parts(
     max_price: Optional[float] = Query(None),
     in_stock: Optional[bool] = Query(None),
     device: Optional[str] = Query(None),
+    include: Optional[str] = Query(None, description="Comma-separated extras; 'samsung' adds the samsung_match_*/samsung_category fields"),
+    after_id: Optional[int] = Query(None, description="Keyset pagination: return parts with id greater than this"),
     db: Session = Depends(get_db)
 ):
-    query = db.query(PartModel)
-    
-    # Apply filters
-    if search:
-        s = (search or "").strip()
-        filters = []
-        # Direct case-insensitive match on code/description
-        filters.append(PartModel.code.ilike(f"%{s}%"))
-        filters.append(PartModel.description.ilike(f"%{s}%"))
-        # Normalized variant without punctuation, uppercased
-        s_norm = re.sub(r"[^A-Za-z0-9]+", "", s).upper()
-        if s_norm and s_norm != s:
-            filters.append(PartModel.code.ilike(f"%{s_norm}%"))
-            filters.append(PartModel.description.ilike(f"%{s_norm}%"))
-        # Numeric-tail fallback: for queries like 's928' also match '928'
-        for m in re.finditer(r"\d{3,4}", s):
-            tail = m.group(0)
-            filters.append(PartModel.code.ilike(f"%{tail}%"))
-            filters.append(PartModel.description.ilike(f"%{tail}%"))
-        # Also try lead-letter + tail pattern (e.g., S928)
-        lm = re.search(r"([A-Za-z])(\d{3,4})", s_norm or s)
-        if lm:
-            lead = lm.group(1).upper()
-            body = lm.group(2)
-            pattern = f"%{lead}{body}%"
-            filters.append(PartModel.code.ilike(pattern))
-            filters.append(PartModel.description.ilike(pattern))
-        query = query.filter(or_(*filters))
-    
-    if status:
-        query = query.filter(PartModel.status == status)
-    
-    if min_price is not None:
-        query = query.filter(PartModel.map_price >= min_price)
-    
-    if max_price is not None:
-        query = query.filter(PartModel.map_price <= max_price)
-    
-    if in_stock is not None:
-        if in_stock:
-            query = query.filter(PartModel.stock_qty > 0)
-        else:
-            query = query.filter(PartModel.stock_qty == 0)
-    
-    # Optimized device filtering: translate device key to SQL patterns to narrow result set before enrichment
-    if device:
-        dev = (device or '').strip().lower()
-        # device key is "name||code" (lowercased). Extract both parts.
-        name_lc, code_lc = None, None
-        if '||' in dev:
-            parts_key = dev.split('||', 1)
-            name_lc = parts_key[0] or None
-            code_lc = parts_key[1] or None
-        else:
-            # Fallback: treat entire value as code
-            code_lc = dev
-        # Try to load Samsung model for more accurate patterns
-        model_obj = None
-        if code_lc:
-            model_obj = db.query(SamsungModelORM).filter(SamsungModelORM.model_code.ilike(code_lc)).first()
-        if not model_obj and name_lc:
-            model_obj = db.query(SamsungModelORM).filter(SamsungModelORM.model_name.ilike(name_lc)).first()
-
-        patterns = set()
-        def add(p: Optional[str]):
-            if p:
-                patterns.add(p.lower())
-        
-        def base_code(code: Optional[str]) -> Optional[str]:
-            if not code:
-                return None
-            c = code.split('/')[0]
-            m = re.match(r"^([A-Z]{2}-[A-Z0-9]*?\d+)", c, re.IGNORECASE)
-            return m.group(1).upper() if m else c.upper()
-
-        def build_patterns_from_code(c_full: str):
-            c_full_u = (c_full or '').upper()
-            add(c_full_u)
-            c_no_region = c_full_u.split('/')[0]
-            add(c_no_region)
-            c_no_sm = c_no_region.replace('SM-', '')
-            add(c_no_sm)
-            # Body after hyphen
-            m2 = re.match(r"^[A-Z]{1,2}-(\w+)$", c_no_region)
-            code_body = m2.group(1) if m2 else c_no_region
-            add(code_body)
-            code_body_nosuf = re.sub(r"[A-Z]$", "", code_body)
-            add(code_body_nosuf)
-            # Lead letter + numeric tail (e.g., S928)
-            mnum = re.search(r"(\d{3,4})", code_body)
-            if mnum:
-                tail = mnum.group(1)
-                # determine lead letter
-                mlead = re.match(r"^(?:SM-)?([A-Z])", c_no_region)
-                lead = mlead.group(1) if mlead else ''
-                if lead:
-                    add(f"{lead}{tail}")
-                    add(f"SM-{lead}{tail}")
-                # Do NOT add tail alone to avoid false positives in SQL prefiltering
-
-        if model_obj and getattr(model_obj, 'model_code', None):
-            build_patterns_from_code(model_obj.model_code)
-        elif code_lc:
-            build_patterns_from_code(code_lc)
-        if model_obj and getattr(model_obj, 'model_name', None):
-            add(model_obj.model_name)
-        elif name_lc:
-            add(name_lc)
-
-        if patterns:
-            device_filters = []
-            for p in patterns:
-                like = f"%{p}%"
-                device_filters.append(PartModel.code.ilike(like))
-                device_filters.append(PartModel.description.ilike(like))
-            query = query.filter(or_(*device_filters))
-
-        # After narrowing by SQL, paginate now
-        parts = query.offset(skip).limit(limit).all()
+    with_samsung = 'samsung' in (include or '').split(',')
+    matcher = _get_samsung_matcher(db) if (with_samsung or device) else None
+    conds = _parts_conditions(search, status, min_price, max_price, in_stock, device, matcher)
+    # Plain Core row mappings (no ORM identity map), spread straight into the response
+    # dicts; after_id seeks on the primary key instead of making SQLite walk and
+    # discard `skip` rows
+    parts = db.execute(_keyset_page(select(PartModel.__table__).where(*conds), PartModel.id, skip, limit, after_id)).mappings().all()
+
+    # Enrich with Samsung model/category detection only when asked for; the
+    # "code description" text is built once per part and shared by matching and
+    # category inference
+    if with_samsung:
+        texts = [f"{p['code']} {p['description']}" for p in parts]
+        matches = matcher.detect_batch(texts)
     else:
-        parts = query.offset(skip).limit(limit).all()
+        texts = matches = [None] * len(parts)
+
+    def enriched():
+        # Built lazily so each dict is encoded and dropped as the response streams
+        for p, base_text, smatch in zip(parts, texts, matches):
+            final_cat = None
+            if with_samsung:
+                # Category inference from raw text
+                inferred = categorize_samsung_text(base_text)
+                # If we matched a Samsung model, also add its fields into the inference text for better signals
+                if smatch:
+                    inferred = categorize_samsung_text(f"{base_text} {getattr(smatch, 'model_code', '')} {getattr(smatch, 'model_name', '')}") or inferred
+                final_cat = reconcile_category(inferred, getattr(smatch, 'category', None))
+            yield {
+                **p,
+                'samsung_match_name': getattr(smatch, 'model_name', None),
+                'samsung_match_code': getattr(smatch, 'model_code', None),
+                'samsung_category': final_cat,
+            }
 
-    # Enrich with Samsung model/category detection
-    sams = db.query(SamsungModelORM).all()
+    # If device filter provided, do not post-filter here anymore as SQL already narrowed results
+    return StreamingResponse(_json_array_stream(enriched()), media_type="application/json")
 
-    def base_code(code: Optional[str]) -> Optional[str]:
-        if not code:
-            return None
-        c = code.split('/')[0]
-        m = re.match(r"^([A-Z]{2}-[A-Z0-9]*?\d+)", c, re.IGNORECASE)
-        return m.group(1).upper() if m else c.upper()
-
-    code_entries = []  # (pattern_lower, model)
-    name_entries = []  # (name_lower, model)
-    tail_to_models = {}  # e.g., '928' -> [model, ...]
-
-    def add_tail_map(key: str, model):
-        if not key:
-            return
-        tail_to_models.setdefault(key, []).append(model)
-
-    for mobj in sams:
-        if mobj.model_code:
-            c_full = mobj.model_code.upper()
-            # direct
-            code_entries.append((c_full.lower(), mobj))
-            # base (strip region and trailing letter segment)
-            b = base_code(c_full)
-            if b and b.lower() != c_full.lower():
-                code_entries.append((b.lower(), mobj))
-            # also versions without SM-
-            c_no_region = c_full.split('/')[0]
-            c_no_sm = c_no_region.replace('SM-', '')
-            if c_no_sm and c_no_sm.lower() not in [p for p, _ in code_entries]:
-                code_entries.append((c_no_sm.lower(), mobj))
-            # remove last trailing letter (e.g., S928B -> S928)
-            m2 = re.match(r"^[A-Z]{1,2}-(\w+)$", c_no_region)
-            code_body = m2.group(1) if m2 else c_no_region
-            code_body_nosuf = re.sub(r"[A-Z]$", "", code_body)
-            if code_body_nosuf and code_body_nosuf.lower() not in [p for p, _ in code_entries]:
-                code_entries.append((code_body_nosuf.lower(), mobj))
-            # map numeric tail (e.g., S928B -> 928)
-            mnum = re.search(r"(\d{3,4})", code_body)
-            if mnum:
-                add_tail_map(mnum.group(1), mobj)
-        if mobj.model_name:
-            name_entries.append((mobj.model_name.strip().lower(), mobj))
-
-    def detect_for_text(text: str):
-        t = (text or "").lower()
-        # Prefer code matches (longest first)
-        for pat, sm in sorted(code_entries, key=lambda x: len(x[0]), reverse=True):
-            if pat and pat in t:
-                return sm
-        # Fallback to name matches (longest first)
-        for nm, sm in sorted(name_entries, key=lambda x: len(x[0]), reverse=True):
-            if nm and nm in t:
-                return sm
-        # Numeric-tail fallback: detect 3-4 digit sequences like '928' in 'oled928'
-        for mnd in re.finditer(r"\d{3,4}", t):
-            num = mnd.group(0)
-            cands = tail_to_models.get(num)
-            if not cands:
-                continue
-            if len(cands) == 1:
-                return cands[0]
-            # Disambiguate by preceding letter in text (a/s/m/x/p/t/r/l/e, etc.)
-            idx = mnd.start()
-            prev = t[idx - 1] if idx - 1 >= 0 else ''
-            if prev and prev.isalpha():
-                for cand in cands:
-                    cc = (cand.model_code or '').upper().split('/')[0]
-                    mlead = re.match(r"^(?:SM-)?([A-Z])", cc)
-                    lead = mlead.group(1).lower() if mlead else ''
-                    if lead and lead == prev:
-                        return cand
-            # If still ambiguous, prefer categories in this priority: highend > tab > wearable > midend > lowend
-            priority = {"highend": 4, "tab": 3, "wearable": 2, "midend": 1, "lowend": 0}
-            cands_sorted = sorted(cands, key=lambda x: priority.get(getattr(x, 'category', None) or '', 0), reverse=True)
-            return cands_sorted[0]
-        return None
 
-    enriched = []
-    for p in parts:
-        base_text = f"{p.code} {p.description}"
-        smatch = detect_for_text(base_text)
-        # Category inference from raw text
-        inferred = categorize_samsung_text(base_text)
-        # If we matched a Samsung model, also add its fields into the inference text for better signals
-        if smatch:
-            inferred = categorize_samsung_text(f"{base_text} {getattr(smatch, 'model_code', '')} {getattr(smatch, 'model_name', '')}") or inferred
-        final_cat = reconcile_category(inferred, getattr(smatch, 'category', None))
-        item = {
-            'id': p.id,
-            'code': p.code,
-            'description': p.description,
-            'map_price': p.map_price,
-            'status': p.status,
-            'net_price': p.net_price,
-            'diff': p.diff,
-            'stock_qty': p.stock_qty,
-            'gr_qty': p.gr_qty,
-            'gr_usd': p.gr_usd,
-            'created_at': p.created_at,
-            'updated_at': p.updated_at,
-            'samsung_match_name': getattr(smatch, 'model_name', None),
-            'samsung_match_code': getattr(smatch, 'model_code', None),
-            'samsung_category': final_cat,
-        }
-        enriched.append(item)
+# Pagination UIs ask for the same total repeatedly; keep totals briefly, keyed by the
+# filter tuple plus a version that part writes and Excel uploads bump
+PARTS_COUNT_TTL = 5
+_parts_count_cache = TTLCache(maxsize=1024, ttl=PARTS_COUNT_TTL)
+_parts_count_lock = threading.Lock()
+_parts_version = 0
 
-    # If device filter provided, do not post-filter here anymore as SQL already narrowed results
-    return enriched
+
+def invalidate_parts_count() -> None:
+    global _parts_version
+    with _parts_count_lock:
+        _parts_version += 1
+        _parts_count_cache.clear()
 
 
 @app.get("/parts/count")
@@ -542,110 +545,18 @@ async def get_parts_count(
     db: Session = Depends(get_db)
 ):
     """Return total count of parts matching filters (for pagination)."""
-    query = db.query(PartModel)
-
-    if search:
-        s = (search or "").strip()
-        filters = []
-        filters.append(PartModel.code.ilike(f"%{s}%"))
-        filters.append(PartModel.description.ilike(f"%{s}%"))
-        s_norm = re.sub(r"[^A-Za-z0-9]+", "", s).upper()
-        if s_norm and s_norm != s:
-            filters.append(PartModel.code.ilike(f"%{s_norm}%"))
-            filters.append(PartModel.description.ilike(f"%{s_norm}%"))
-        for m in re.finditer(r"\d{3,4}", s):
-            tail = m.group(0)
-            filters.append(PartModel.code.ilike(f"%{tail}%"))
-            filters.append(PartModel.description.ilike(f"%{tail}%"))
-        lm = re.search(r"([A-Za-z])(\d{3,4})", s_norm or s)
-        if lm:
-            lead = lm.group(1).upper()
-            body = lm.group(2)
-            pattern = f"%{lead}{body}%"
-            filters.append(PartModel.code.ilike(pattern))
-            filters.append(PartModel.description.ilike(pattern))
-        query = query.filter(or_(*filters))
-
-    if status:
-        query = query.filter(PartModel.status == status)
-
-    if min_price is not None:
-        query = query.filter(PartModel.map_price >= min_price)
-
-    if max_price is not None:
-        query = query.filter(PartModel.map_price <= max_price)
+    key = (_parts_version, search, status, min_price, max_price, in_stock, device)
+    with _parts_count_lock:
+        total = _parts_count_cache.get(key)
+    if total is not None:
+        return {"total": total}
 
-    if in_stock is not None:
-        if in_stock:
-            query = query.filter(PartModel.stock_qty > 0)
-        else:
-            query = query.filter(PartModel.stock_qty == 0)
-
-    if not device:
-        total = query.count()
-        return {"total": int(total)}
-
-    # Optimized device count: apply same SQL prefilter patterns and use COUNT(*)
-    dev = (device or '').strip().lower()
-    name_lc, code_lc = None, None
-    if '||' in dev:
-        parts_key = dev.split('||', 1)
-        name_lc = parts_key[0] or None
-        code_lc = parts_key[1] or None
-    else:
-        code_lc = dev
-
-    model_obj = None
-    if code_lc:
-        model_obj = db.query(SamsungModelORM).filter(SamsungModelORM.model_code.ilike(code_lc)).first()
-    if not model_obj and name_lc:
-        model_obj = db.query(SamsungModelORM).filter(SamsungModelORM.model_name.ilike(name_lc)).first()
-
-    patterns = set()
-    def add(p: Optional[str]):
-        if p:
-            patterns.add(p.lower())
-
-    def build_patterns_from_code(c_full: str):
-        c_full_u = (c_full or '').upper()
-        add(c_full_u)
-        c_no_region = c_full_u.split('/')[0]
-        add(c_no_region)
-        c_no_sm = c_no_region.replace('SM-', '')
-        add(c_no_sm)
-        m2 = re.match(r"^[A-Z]{1,2}-(\w+)$", c_no_region)
-        code_body = m2.group(1) if m2 else c_no_region
-        add(code_body)
-        code_body_nosuf = re.sub(r"[A-Z]$", "", code_body)
-        add(code_body_nosuf)
-        mnum = re.search(r"(\d{3,4})", code_body)
-        if mnum:
-            tail = mnum.group(1)
-            mlead = re.match(r"^(?:SM-)?([A-Z])", c_no_region)
-            lead = mlead.group(1) if mlead else ''
-            if lead:
-                add(f"{lead}{tail}")
-                add(f"SM-{lead}{tail}")
-
-    if model_obj and getattr(model_obj, 'model_code', None):
-        build_patterns_from_code(model_obj.model_code)
-    elif code_lc:
-        build_patterns_from_code(code_lc)
-    if model_obj and getattr(model_obj, 'model_name', None):
-        add(model_obj.model_name)
-    elif name_lc:
-        add(name_lc)
-
-    if patterns:
-        device_filters = []
-        for p in patterns:
-            like = f"%{p}%"
-            device_filters.append(PartModel.code.ilike(like))
-            device_filters.append(PartModel.description.ilike(like))
-        query = query.filter(or_(*device_filters))
-
-    total = query.count()
-    return {"total": int(total)}
+    matcher = _get_samsung_matcher(db) if device else None
+    conds = _parts_conditions(search, status, min_price, max_price, in_stock, device, matcher)
+    total = int(db.execute(select(func.count(PartModel.id)).where(*conds)).scalar())
+    with _parts_count_lock:
+        _parts_count_cache[key] = total
+    return {"total": total}
 
 
 @app.get("/detect-samsung")
@@ -654,81 +565,7 @@ async def detect_samsung(text: str = Query(..., min_length=1), db: Session = Dep
     Detect Samsung model and category from arbitrary text (e.g., part description/code).
     Returns a simple JSON payload: { model_name, model_code, category } or all None if not found.
     """
-    sams = db.query(SamsungModelORM).all()
-
-    def base_code(code: Optional[str]) -> Optional[str]:
-        if not code:
-            return None
-        c = code.split('/')[0]
-        m = re.match(r"^([A-Z]{2}-[A-Z0-9]*?\d+)", c, re.IGNORECASE)
-        return m.group(1).upper() if m else c.upper()
-
-    code_entries = []
-    name_entries = []
-    tail_to_models = {}
-
-    def add_tail_map(key: str, model):
-        if not key:
-            return
-        tail_to_models.setdefault(key, []).append(model)
-
-    for mobj in sams:
-        if mobj.model_code:
-            c_full = mobj.model_code.upper()
-            code_entries.append((c_full.lower(), mobj))
-            b = base_code(c_full)
-            if b and b.lower() != c_full.lower():
-                code_entries.append((b.lower(), mobj))
-            c_no_region = c_full.split('/')[0]
-            c_no_sm = c_no_region.replace('SM-', '')
-            if c_no_sm:
-                code_entries.append((c_no_sm.lower(), mobj))
-            m2 = re.match(r"^[A-Z]{1,2}-(\w+)$", c_no_region)
-            code_body = m2.group(1) if m2 else c_no_region
-            code_body_nosuf = re.sub(r"[A-Z]$", "", code_body)
-            if code_body_nosuf:
-                code_entries.append((code_body_nosuf.lower(), mobj))
-            mnum = re.search(r"(\d{3,4})", code_body)
-            if mnum:
-                add_tail_map(mnum.group(1), mobj)
-        if mobj.model_name:
-            name_entries.append((mobj.model_name.strip().lower(), mobj))
-
-    def detect_for_text(t: str):
-        s = (t or "").lower()
-        # Prefer code matches (longest first)
-        for pat, sm in sorted(code_entries, key=lambda x: len(x[0]), reverse=True):
-            if pat and pat in s:
-                return sm
-        # Fallback to name matches (longest first)
-        for nm, sm in sorted(name_entries, key=lambda x: len(x[0]), reverse=True):
-            if nm and nm in s:
-                return sm
-        # Numeric-tail fallback: detect 3-4 digit sequences like '928' in 'oled928'
-        for mnd in re.finditer(r"\d{3,4}", s):
-            num = mnd.group(0)
-            cands = tail_to_models.get(num)
-            if not cands:
-                continue
-            if len(cands) == 1:
-                return cands[0]
-            # Disambiguate by preceding letter in text (a/s/m/x/p/t/r/l/e, etc.)
-            idx = mnd.start()
-            prev = s[idx - 1] if idx - 1 >= 0 else ''
-            if prev and prev.isalpha():
-                for cand in cands:
-                    cc = (cand.model_code or '').upper().split('/')[0]
-                    mlead = re.match(r"^(?:SM-)?([A-Z])", cc)
-                    lead = mlead.group(1).lower() if mlead else ''
-                    if lead and lead == prev:
-                        return cand
-            # If still ambiguous, prefer categories in this priority: highend > tab > wearable > midend > lowend
-            priority = {"highend": 4, "tab": 3, "wearable": 2, "midend": 1, "lowend": 0}
-            cands_sorted = sorted(cands, key=lambda x: priority.get(getattr(x, 'category', None) or '', 0), reverse=True)
-            return cands_sorted[0]
-        return None
-
-    smatch = detect_for_text(text)
+    smatch = _get_samsung_matcher(db).detect(text)
     inferred = categorize_samsung_text(text)
     if smatch:
         inferred = categorize_samsung_text(f"{text} {getattr(smatch, 'model_code', '')} {getattr(smatch, 'model_name', '')}") or inferred
@@ -755,105 +592,11 @@ async def get_device_options(
     # Base query limited to needed columns only
     query = db.query(PartModel.code, PartModel.description)
 
-    if search:
-        s = (search or "").strip()
-        filters = []
-        filters.append(PartModel.code.ilike(f"%{s}%"))
-        filters.append(PartModel.description.ilike(f"%{s}%"))
-        s_norm = re.sub(r"[^A-Za-z0-9]+", "", s).upper()
-        if s_norm and s_norm != s:
-            filters.append(PartModel.code.ilike(f"%{s_norm}%"))
-            filters.append(PartModel.description.ilike(f"%{s_norm}%"))
-        for m in re.finditer(r"\d{3,4}", s):
-            tail = m.group(0)
-            filters.append(PartModel.code.ilike(f"%{tail}%"))
-            filters.append(PartModel.description.ilike(f"%{tail}%"))
-        lm = re.search(r"([A-Za-z])(\d{3,4})", s_norm or s)
-        if lm:
-            lead = lm.group(1).upper()
-            body = lm.group(2)
-            pattern = f"%{lead}{body}%"
-            filters.append(PartModel.code.ilike(pattern))
-            filters.append(PartModel.description.ilike(pattern))
-        query = query.filter(or_(*filters))
+    # Same search/status predicates as /parts (FTS-backed search terms)
+    query = query.filter(*_parts_conditions(search, status, None, None, None, None, None))
 
-    if status:
-        query = query.filter(PartModel.status == status)
-
-    # Preload Samsung models and build detection indices (mirrors logic in /parts)
-    sams = db.query(SamsungModelORM).all()
-
-    def base_code(code: Optional[str]) -> Optional[str]:
-        if not code:
-            return None
-        c = code.split('/')[0]
-        m = re.match(r"^([A-Z]{2}-[A-Z0-9]*?\d+)", c, re.IGNORECASE)
-        return m.group(1).upper() if m else c.upper()
-
-    code_entries = []  # (pattern_lower, model)
-    name_entries = []  # (name_lower, model)
-    tail_to_models = {}
-
-    def add_tail_map(key: str, model):
-        if not key:
-            return
-        tail_to_models.setdefault(key, []).append(model)
-
-    for mobj in sams:
-        if mobj.model_code:
-            c_full = mobj.model_code.upper()
-            code_entries.append((c_full.lower(), mobj))
-            b = base_code(c_full)
-            if b and b.lower() != c_full.lower():
-                code_entries.append((b.lower(), mobj))
-            c_no_region = c_full.split('/')[0]
-            c_no_sm = c_no_region.replace('SM-', '')
-            if c_no_sm and c_no_sm.lower() not in [p for p, _ in code_entries]:
-                code_entries.append((c_no_sm.lower(), mobj))
-            m2 = re.match(r"^[A-Z]{1,2}-(\w+)$", c_no_region)
-            code_body = m2.group(1) if m2 else c_no_region
-            code_body_nosuf = re.sub(r"[A-Z]$", "", code_body)
-            if code_body_nosuf and code_body_nosuf.lower() not in [p for p, _ in code_entries]:
-                code_entries.append((code_body_nosuf.lower(), mobj))
-            mnum = re.search(r"(\d{3,4})", code_body)
-            if mnum:
-                add_tail_map(mnum.group(1), mobj)
-        if mobj.model_name:
-            name_entries.append((mobj.model_name.strip().lower(), mobj))
-
-    def detect_for_text(text: str):
-        t = (text or "").lower()
-        # Prefer code matches (longest first)
-        for pat, sm in sorted(code_entries, key=lambda x: len(x[0]), reverse=True):
-            if pat and pat in t:
-                return sm
-        # Fallback to name matches (longest first)
-        for nm, sm in sorted(name_entries, key=lambda x: len(x[0]), reverse=True):
-            if nm and nm in t:
-                return sm
-        # Numeric-tail fallback: detect 3-4 digit sequences like '928' in 'oled928'
-        for mnd in re.finditer(r"\d{3,4}", t):
-            num = mnd.group(0)
-            cands = tail_to_models.get(num)
-            if not cands:
-                continue
-            if len(cands) == 1:
-                return cands[0]
-            # Disambiguate by preceding letter in text (a/s/m/x/p/t/r/l/e, etc.)
-            idx = mnd.start()
-            prev = t[idx - 1] if idx - 1 >= 0 else ''
-            if prev and prev.isalpha():
-                for cand in cands:
-                    cc = (cand.model_code or '').upper().split('/')[0]
-                    mlead = re.match(r"^(?:SM-)?([A-Z])", cc)
-                    lead = mlead.group(1).lower() if mlead else ''
-                    if lead and lead == prev:
-                        return cand
-            # If still ambiguous, prefer categories in this priority: highend > tab > wearable > midend > lowend
-            priority = {"highend": 4, "tab": 3, "wearable": 2, "midend": 1, "lowend": 0}
-            cands_sorted = sorted(cands, key=lambda x: priority.get(getattr(x, 'category', None) or '', 0), reverse=True)
-            return cands_sorted[0]
-        return None
+    # Cached Samsung detection index (shared with /parts)
+    matcher = _get_samsung_matcher(db)
 
     seen = set()
     results = []
@@ -863,7 +606,7 @@ async def get_device_options(
         text = f"{row.code or ''} {row.description or ''}".strip()
         if not text:
             continue
-        smatch = detect_for_text(text)
+        smatch = matcher.detect(text)
         if not smatch:
             continue
         name = (getattr(smatch, 'model_name', None) or '').strip()
@@ -889,100 +632,23 @@ async def get_device_options(
 
     # Sort by label for stable UX
     results.sort(key=lambda x: x['label'])
-    return results
+    return StreamingResponse(_json_array_stream(results), media_type="application/json")
 
 
 @app.get("/parts/{part_id}", response_model=Part)
 async def get_part(part_id: int, db: Session = Depends(get_db)):
-    part = db.query(PartModel).filter(PartModel.id == part_id).first()
+    part = db.execute(select(PartModel.__table__).where(PartModel.id == part_id)).mappings().first()
     if part is None:
         raise HTTPException(status_code=404, detail="Part not found")
 
-    sams = db.query(SamsungModelORM).all()
-    def base_code(code: Optional[str]) -> Optional[str]:
-        if not code:
-            return None
-        c = code.split('/')[0]
-        m = re.match(r"^([A-Z]{2}-[A-Z0-9]*?\d+)", c, re.IGNORECASE)
-        return m.group(1).upper() if m else c.upper()
-
-    code_entries = []
-    name_entries = []
-    tail_to_models = {}
-
-    def add_tail_map(key: str, model):
-        if not key:
-            return
-        tail_to_models.setdefault(key, []).append(model)
-
-    for mobj in sams:
-        if mobj.model_code:
-            cf = mobj.model_code.upper()
-            code_entries.append((cf.lower(), mobj))
-            b = base_code(cf)
-            if b and b.lower() != cf.lower():
-                code_entries.append((b.lower(), mobj))
-            c_no_region = cf.split('/')[0]
-            c_no_sm = c_no_region.replace('SM-', '')
-            code_entries.append((c_no_sm.lower(), mobj))
-            m2 = re.match(r"^[A-Z]{1,2}-(\w+)$", c_no_region)
-            code_body = m2.group(1) if m2 else c_no_region
-            code_body_nosuf = re.sub(r"[A-Z]$", "", code_body)
-            code_entries.append((code_body_nosuf.lower(), mobj))
-            mnum = re.search(r"(\d{3,4})", code_body)
-            if mnum:
-                add_tail_map(mnum.group(1), mobj)
-        if mobj.model_name:
-            name_entries.append((mobj.model_name.strip().lower(), mobj))
-
-    def detect_for_text(text: str):
-        t = (text or "").lower()
-        for pat, sm in sorted(code_entries, key=lambda x: len(x[0]), reverse=True):
-            if pat and pat in t:
-                return sm
-        for nm, sm in sorted(name_entries, key=lambda x: len(x[0]), reverse=True):
-            if nm and nm in t:
-                return sm
-        for mnd in re.finditer(r"\d{3,4}", t):
-            num = mnd.group(0)
-            cands = tail_to_models.get(num)
-            if not cands:
-                continue
-            if len(cands) == 1:
-                return cands[0]
-            idx = mnd.start()
-            prev = t[idx - 1] if idx - 1 >= 0 else ''
-            if prev and prev.isalpha():
-                for cand in cands:
-                    cc = (cand.model_code or '').upper().split('/')[0]
-                    mlead = re.match(r"^(?:SM-)?([A-Z])", cc)
-                    lead = mlead.group(1).lower() if mlead else ''
-                    if lead and lead == prev:
-                        return cand
-            # If still ambiguous, prefer categories in this priority: highend > tab > wearable > midend > lowend
-            priority = {"highend": 4, "tab": 3, "wearable": 2, "midend": 1, "lowend": 0}
-            cands_sorted = sorted(cands, key=lambda x: priority.get(getattr(x, 'category', None) or '', 0), reverse=True)
-            return cands_sorted[0]
-        return None
-
-    smatch = detect_for_text(part.code)
-    inferred = categorize_samsung_text(part.code)
+    code = part['code']
+    smatch = _get_samsung_matcher(db).detect(code)
+    inferred = categorize_samsung_text(code)
     if smatch:
-        inferred = categorize_samsung_text(f"{part.code} {getattr(smatch, 'model_code', '')} {getattr(smatch, 'model_name', '')}") or inferred
+        inferred = categorize_samsung_text(f"{code} {getattr(smatch, 'model_code', '')} {getattr(smatch, 'model_name', '')}") or inferred
     final_cat = reconcile_category(inferred, getattr(smatch, 'category', None))
     return {
-        'id': part.id,
-        'code': part.code,
-        'description': part.description,
-        'map_price': part.map_price,
-        'status': part.status,
-        'net_price': part.net_price,
-        'diff': part.diff,
-        'stock_qty': part.stock_qty,
-        'gr_qty': part.gr_qty,
-        'gr_usd': part.gr_usd,
-        'created_at': part.created_at,
-        'updated_at': part.updated_at,
+        **part,
         'samsung_match_name': getattr(smatch, 'model_name', None),
         'samsung_match_code': getattr(smatch, 'model_code', None),
         'samsung_category': final_cat,
@@ -1004,7 +670,12 @@ async def create_part(part: PartCreate, db: Session = Depends(get_db), current_u
         gr_usd=part.gr_usd,
     )
     db.add(db_part)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Part code already exists")
+    invalidate_parts_count()
     db.refresh(db_part)
     return db_part
 
@@ -1020,7 +691,12 @@ async def update_part(part_id: int, updates: PartUpdate, db: Session = Depends(g
     for field, value in updates.dict(exclude_unset=True).items():
         setattr(part, field, value)
 
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Part code already exists")
+    invalidate_parts_count()
     db.refresh(part)
     return part
 
@@ -1033,45 +709,23 @@ async def delete_part(part_id: int, db: Session = Depends(get_db), current_user:
         raise HTTPException(status_code=404, detail="Part not found")
     db.delete(part)
     db.commit()
+    invalidate_parts_count()
     return None
 
 
-@app.post("/upload-excel", response_model=ExcelUploadResponse)
-async def upload_excel(file: UploadFile = File(...), db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    require_permission(current_user, 'upload_excel')
-    # Accept .xlsx or .xls
-    fname = (file.filename or "").lower()
-    if not (fname.endswith(".xlsx") or fname.endswith(".xls")):
-        raise HTTPException(status_code=400, detail="Invalid file type, only .xls/.xlsx allowed")
-
-    content = await file.read()
-
+def _process_upload(fileobj, filename: str, db: Session) -> dict:
+    """Parse an uploaded workbook and upsert its parts/formulas (blocking; run off the event loop)"""
     # Helper: normalize columns
     def norm_cols(df: pd.DataFrame) -> pd.DataFrame:
         df.columns = (
             df.columns
             .str.strip()
             .str.lower()
-            .str.replace(r"\s+", "_", regex=True)
-            .str.replace(r"[\\./-]+", "_", regex=True)
+            .str.replace(_HEADER_WS_RE, "_", regex=True)
+            .str.replace(_HEADER_SEP_RE, "_", regex=True)
         )
         return df
 
-    # Read parts sheet (prefer 'Parts' else first sheet)
-    try:
-        xls = pd.ExcelFile(io.BytesIO(content))
-        sheet_name = 'Parts' if 'Parts' in xls.sheet_names else 0
-        parts_df = pd.read_excel(
-            io.BytesIO(content),
-            sheet_name=sheet_name,
-            na_values=["#N/A", "N/A", "NA", "-", "—", "#REF!", "#NULL!"],
-            keep_default_na=True
-        )
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to read Excel file: {e}")
-
-    parts_df = norm_cols(parts_df)
-
     column_mapping = {
         'part_code': 'code', 'part_number': 'code', 'part_no': 'code', 'parts_no': 'code',
         'p_no': 'code', 'p_no_': 'code', 'p_no__': 'code', 'item_code': 'code', 'material': 'code',
@@ -1089,6 +743,39 @@ async def upload_excel(file: UploadFile = File(...), db: Session = Depends(get_d
         # Newer provided headers
         'mo_avg_price': 'map_price', 'mo_avg_amount': 'gr_usd',
     }
+
+    def wanted_col(c) -> bool:
+        # Same normalization as norm_cols; keeps only mapped columns and 'code' heuristic candidates
+        n = _HEADER_SEP_RE.sub("_", _HEADER_WS_RE.sub("_", str(c).strip().lower()))
+        return n in column_mapping or 'code' in n or n in ('part', 'parts')
+
+    # Read parts sheet (prefer 'Parts' else first sheet) with the Rust calamine parser,
+    # materializing only the columns the import can use
+    # Both sheets come from one parsed workbook handle, closed as soon as they are read.
+    # The upload is parsed straight from Starlette's spooled temp file (memory up to
+    # 1 MB, disk beyond) rather than from a second in-memory copy of the body.
+    fdf = None
+    try:
+        fileobj.seek(0)
+        with pd.ExcelFile(fileobj, engine="calamine") as xls:
+            sheet_name = 'Parts' if 'Parts' in xls.sheet_names else 0
+            parts_df = pd.read_excel(
+                xls,
+                sheet_name=sheet_name,
+                usecols=wanted_col,
+                na_values=["#N/A", "N/A", "NA", "-", "—", "#REF!", "#NULL!"],
+                keep_default_na=True
+            )
+            if 'Formulas' in xls.sheet_names:
+                try:
+                    fdf = pd.read_excel(xls, sheet_name='Formulas')
+                except Exception:
+                    pass  # a broken Formulas sheet only means 0 formulas imported
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to read Excel file: {e}")
+
+    parts_df = norm_cols(parts_df)
+
     rename_dict = {c: column_mapping[c] for c in parts_df.columns if c in column_mapping}
     parts_df = parts_df.rename(columns=rename_dict)
 
@@ -1120,60 +807,72 @@ async def upload_excel(file: UploadFile = File(...), db: Session = Depends(get_d
         parts_df = parts_df[parts_df['code'].str.len() > 0]
         parts_df = parts_df[parts_df['code'].str.lower() != 'nan']
     if 'description' in parts_df.columns:
-        parts_df['description'] = parts_df['description'].astype(str).str.strip().str.replace(r';+$','', regex=True)
+        desc = parts_df['description'].astype(str).str.strip().str.replace(_TRAIL_SEMI_RE, '', regex=True).str.strip()
+        # Common placeholders count as "no description" (they never overwrite or get stored);
+        # object dtype so missing values become None below (the str dtype would keep NaN)
+        parts_df['description'] = desc.mask(desc.str.lower().isin(_DESC_PLACEHOLDERS)).astype(object)
     if 'status' in parts_df.columns:
         parts_df['status'] = parts_df['status'].fillna('Active')
 
-    # Coerce numerics
-    for num_col in ['map_price','net_price','diff','stock_qty','gr_qty','gr_usd']:
-        if num_col in parts_df.columns:
-            parts_df[num_col] = pd.to_numeric(parts_df[num_col], errors='coerce')
+    # Coerce numerics (one apply over all present numeric columns)
+    numeric_cols = [c for c in ['map_price','net_price','diff','stock_qty','gr_qty','gr_usd'] if c in parts_df.columns]
+    if numeric_cols:
+        parts_df[numeric_cols] = parts_df[numeric_cols].apply(pd.to_numeric, errors='coerce')
+    # Whole-number quantity columns shrink to the smallest int dtype; prices stay float64
+    # (float32 would lose the cents that the DECIMAL columns keep)
+    qty_cols = [c for c in ['stock_qty','gr_qty'] if c in parts_df.columns]
+    if qty_cols:
+        parts_df[qty_cols] = parts_df[qty_cols].apply(pd.to_numeric, downcast='integer')
 
     parts_df = parts_df.where(pd.notnull(parts_df), None)
 
     # Upsert parts
     parts_imported = 0
-    for _, row in parts_df.iterrows():
-        code = row.get('code')
+    # One SELECT up front instead of one per row; descriptions are kept so the
+    # "don't overwrite a non-empty description" rule needs no extra lookups
+    existing = {code: (pk, desc) for pk, code, desc in db.execute(select(PartModel.id, PartModel.code, PartModel.description))}
+    # Rows are partitioned into plain mappings and written with the bulk APIs
+    # (no ORM instances / identity map); repeated codes merge into one mapping
+    to_insert = {}  # code -> mapping for a new part
+    to_update = {}  # id -> mapping for an existing part
+    cols_order = list(parts_df.columns)
+    for row in parts_df.itertuples(index=False, name=None):
+        fields = dict(zip(cols_order, row))
+        code = fields.get('code')
         if not code:
             continue
-        existing = db.query(PartModel).filter(PartModel.code == code).first()
-        fields = {k: row.get(k) for k in keep_cols if k in parts_df.columns}
-        if existing:
+        target = to_insert.get(code)
+        if target is not None or code in existing:
+            if target is not None:
+                current_desc = target.get('description')
+            else:
+                pk, current_desc = existing[code]
+                target = to_update.setdefault(pk, {'id': pk})
+                current_desc = target.get('description', current_desc)
             for k, v in fields.items():
                 if k == 'code' or v is None:
                     continue
                 if k == 'description':
                     # Do not overwrite an existing non-empty description
-                    current_desc = getattr(existing, 'description', None)
                     if current_desc is None or str(current_desc).strip() == '':
-                        incoming = str(v).strip()
-                        # Treat common placeholders as empty
-                        if incoming.lower() in ('nan', 'none', '-', '--', 'n/a', '#n/a'):
-                            continue
-                        setattr(existing, 'description', incoming)
-                    else:
-                        # Keep existing description
-                        continue
+                        target['description'] = v
                 else:
-                    setattr(existing, k, v)
+                    target[k] = v
         else:
-            # Normalize incoming description to avoid storing placeholders
-            if 'description' in fields and fields['description'] is not None:
-                incoming = str(fields['description']).strip()
-                if incoming.lower() in ('nan', 'none', '-', '--', 'n/a', '#n/a'):
-                    fields['description'] = None
-                else:
-                    fields['description'] = incoming
-            db.add(PartModel(**fields))
+            to_insert[code] = fields
         parts_imported += 1
+    if to_insert:
+        db.bulk_insert_mappings(PartModel, list(to_insert.values()))
+    updates = [m for m in to_update.values() if len(m) > 1]
+    if updates:
+        db.bulk_update_mappings(PartModel, updates)
     db.commit()
+    invalidate_parts_count()
 
     # Optional: formulas sheet
     formulas_imported = 0
     try:
-        if 'Formulas' in xls.sheet_names:
-            fdf = pd.read_excel(io.BytesIO(content), sheet_name='Formulas')
+        if fdf is not None:
             fdf = norm_cols(fdf)
             formula_mapping = {
                 'class': 'class_name', 'class_name': 'class_name',
@@ -1187,58 +886,83 @@ async def upload_excel(file: UploadFile = File(...), db: Session = Depends(get_d
                 'final': 'final_price', 'final_price': 'final_price'
             }
             fdf = fdf.rename(columns={c: formula_mapping[c] for c in fdf.columns if c in formula_mapping})
-            for c in ['labor_lvl1','labor_lvl2','labor_lvl3','labor_lvl2_major','labor_lvl2_minor','exchange_rate','final_price','margin','total_map']:
-                if c in fdf.columns:
-                    fdf[c] = pd.to_numeric(fdf[c], errors='coerce')
+            numeric_cols = [c for c in ['labor_lvl1','labor_lvl2','labor_lvl3','labor_lvl2_major','labor_lvl2_minor','exchange_rate','final_price','margin','total_map'] if c in fdf.columns]
+            if numeric_cols:
+                fdf[numeric_cols] = fdf[numeric_cols].apply(pd.to_numeric, errors='coerce')
             if 'margin' in fdf.columns:
                 fdf['margin'] = fdf['margin'].apply(lambda x: (x * 100.0) if pd.notnull(x) and x < 1 else x)
             fdf = fdf.where(pd.notnull(fdf), None)
 
-            for _, row in fdf.iterrows():
-                cls = row.get('class_name')
+            # Do not import total_map/final_price into formula; those are computed elsewhere
+            payload_keys = ['class_name','labor_lvl1','labor_lvl2','labor_lvl3','labor_lvl2_major','labor_lvl2_minor','margin','exchange_rate']
+            fcols_order = [k for k in payload_keys if k in fdf.columns]
+            # Same shape as the parts upsert: one IN lookup, then bulk insert/update mappings
+            classes = {c for c in fdf['class_name'] if c} if 'class_name' in fdf.columns else set()
+            formula_ids = dict(db.execute(
+                select(FormulaModel.class_name, FormulaModel.id).where(FormulaModel.class_name.in_(classes))
+            ).all()) if classes else {}
+            to_insert = {}  # class_name -> mapping for a new formula
+            to_update = {}  # id -> mapping for an existing formula
+            for row in fdf[fcols_order].itertuples(index=False, name=None):
+                payload = dict(zip(fcols_order, row))
+                cls = payload.get('class_name')
                 if not cls:
                     continue
-                existing = db.query(FormulaModel).filter(FormulaModel.class_name == cls).first()
-                # Do not import total_map/final_price into formula; those are computed elsewhere
-                payload_keys = ['class_name','labor_lvl1','labor_lvl2','labor_lvl3','labor_lvl2_major','labor_lvl2_minor','margin','exchange_rate']
-                payload = {k: row.get(k) for k in payload_keys if k in fdf.columns}
-                if existing:
-                    for k, v in payload.items():
-                        if k != 'class_name' and v is not None:
-                            setattr(existing, k, v)
+                target = to_insert.get(cls)
+                if target is None and cls in formula_ids:
+                    target = to_update.setdefault(formula_ids[cls], {'id': formula_ids[cls]})
+                if target is not None:
+                    target.update((k, v) for k, v in payload.items() if k != 'class_name' and v is not None)
                 else:
-                    db.add(FormulaModel(**payload))
+                    to_insert[cls] = payload
                 formulas_imported += 1
+            if to_insert:
+                db.bulk_insert_mappings(FormulaModel, list(to_insert.values()))
+            updates = [m for m in to_update.values() if len(m) > 1]
+            if updates:
+                db.bulk_update_mappings(FormulaModel, updates)
             db.commit()
     except Exception:
         # Ignore formulas errors, just report 0
         pass
 
     return {
-        "message": f"Imported {parts_imported} parts and {formulas_imported} formulas from {file.filename}",
+        "message": f"Imported {parts_imported} parts and {formulas_imported} formulas from {filename}",
         "parts_imported": int(parts_imported),
         "formulas_imported": int(formulas_imported),
     }
 
 
+@app.post("/upload-excel", response_model=ExcelUploadResponse)
+async def upload_excel(file: UploadFile = File(...), db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    require_permission(current_user, 'upload_excel')
+    # Accept .xlsx or .xls
+    fname = (file.filename or "").lower()
+    if not (fname.endswith(".xlsx") or fname.endswith(".xls")):
+        raise HTTPException(status_code=400, detail="Invalid file type, only .xls/.xlsx allowed")
+
+    # pandas parsing and the bulk writes are synchronous; running them on the threadpool
+    # keeps the event loop serving other requests for the duration of the upload
+    return await run_in_threadpool(_process_upload, file.file, file.filename, db)
+
+
 @app.get("/samsung-models/", response_model=List[SamsungModel])
 async def get_samsung_models(
     skip: int = 0,
     limit: int = 100,
     search: Optional[str] = Query(None),
     category: Optional[str] = Query(None),
+    after_id: Optional[int] = Query(None),
     db: Session = Depends(get_db)
 ):
-    query = db.query(SamsungModelORM)
+    query = select(SamsungModelORM.__table__)
     if search:
-        query = query.filter(
-            (SamsungModelORM.model_code.contains(search)) | 
-            (SamsungModelORM.model_name.contains(search))
-        )
+        query = query.where(_fts_contains_any(
+            SamsungModelORM, 'samsung_models_fts', (SamsungModelORM.model_code, SamsungModelORM.model_name), (search,)
+        ))
     if category:
-        query = query.filter(SamsungModelORM.category == category)
-    models = query.offset(skip).limit(limit).all()
-    return models
+        query = query.where(SamsungModelORM.category == category)
+    return db.execute(_keyset_page(query, SamsungModelORM.id, skip, limit, after_id)).mappings().all()
 
 
 @app.post("/samsung-models/", response_model=SamsungModel)
@@ -1251,6 +975,7 @@ async def create_samsung_model(model: SamsungModelCreate, db: Session = Depends(
     )
     db.add(db_model)
     db.commit()
+    invalidate_samsung_index()
     db.refresh(db_model)
     return db_model
 
@@ -1258,7 +983,7 @@ async def create_samsung_model(model: SamsungModelCreate, db: Session = Depends(
 @app.put("/samsung-models/{model_id}", response_model=SamsungModel)
 async def update_samsung_model(model_id: int, updates: SamsungModelUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     require_permission(current_user, 'manage_samsung_models')
-    model = db.query(SamsungModelORM).filter(SamsungModelORM.id == model_id).first()
+    model = db.get(SamsungModelORM, model_id)
     if model is None:
         raise HTTPException(status_code=404, detail="Model not found")
 
@@ -1267,6 +992,7 @@ async def update_samsung_model(model_id: int, updates: SamsungModelUpdate, db: S
         setattr(model, field, value)
 
     db.commit()
+    invalidate_samsung_index()
     db.refresh(model)
     return model
 
@@ -1274,11 +1000,12 @@ async def update_samsung_model(model_id: int, updates: SamsungModelUpdate, db: S
 @app.delete("/samsung-models/{model_id}", status_code=204)
 async def delete_samsung_model(model_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     require_permission(current_user, 'manage_samsung_models')
-    model = db.query(SamsungModelORM).filter(SamsungModelORM.id == model_id).first()
+    model = db.get(SamsungModelORM, model_id)
     if model is None:
         raise HTTPException(status_code=404, detail="Model not found")
     db.delete(model)
     db.commit()
+    invalidate_samsung_index()
     return None
 
 
@@ -1287,14 +1014,15 @@ async def get_formulas(
     skip: int = 0,
     limit: int = 100,
     search: Optional[str] = Query(None),
+    after_id: Optional[int] = Query(None),
     db: Session = Depends(get_db)
 ):
-    query = db.query(FormulaModel)
+    query = select(FormulaModel.__table__)
     # Apply filters
     if search:
         # Filter by class_name only (schema has no name/description fields)
-        query = query.filter(FormulaModel.class_name.contains(search))
-    formulas = query.offset(skip).limit(limit).all()
+        query = query.where(FormulaModel.class_name.contains(search))
+    formulas = db.execute(_keyset_page(query, FormulaModel.id, skip, limit, after_id)).mappings().all()
     return formulas
 
 
@@ -1327,7 +1055,11 @@ async def create_formula(formula: FormulaCreate, db: Session = Depends(get_db),
         dealer_margin=dealer_margin_val,
     )
     db.add(db_formula)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Formula class already exists")
     db.refresh(db_formula)
     return db_formula
 
@@ -1352,11 +1084,26 @@ async def update_formula(formula_id: int, updates: FormulaUpdate, db: Session =
     for field, value in payload.items():
         setattr(formula, field, value)
 
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Formula class already exists")
     db.refresh(formula)
     return formula
 
 
+# labor_level -> (customer column, dealer override column) on FormulaModel
+LABOR_ATTRS = {
+    '1': ('labor_lvl1', 'dealer_labor_lvl1'),
+    '2_major': ('labor_lvl2_major', 'dealer_labor_lvl2_major'),
+    '2_minor': ('labor_lvl2_minor', 'dealer_labor_lvl2_minor'),
+    '3': ('labor_lvl3', 'dealer_labor_lvl3'),
+}
+# Tried in order when no (known) labor_level is given; '3' is the final fallback
+DEFAULT_LABOR_ORDER = ('2_major', '2_minor', '1')
+
+
 @app.post("/calculate-price", response_model=PriceResult)
 async def calculate_price(payload: PriceCalculation, db: Session = Depends(get_db)):
     # Resolve parts or use manual MAP when parts are not available
@@ -1375,14 +1122,17 @@ async def calculate_price(payload: PriceCalculation, db: Session = Depends(get_d
     else:
         # Existing logic: support single or multiple parts
         if payload.parts:
+            # One IN query for every selected part instead of one SELECT each
+            ids = {psel.part_id for psel in payload.parts}
+            parts_by_id = {p.id: p for p in db.query(PartModel).options(raiseload('*')).filter(PartModel.id.in_(ids))}
             for psel in payload.parts:
-                p = db.query(PartModel).filter(PartModel.id == psel.part_id).first()
+                p = parts_by_id.get(psel.part_id)
                 if not p:
                     raise HTTPException(status_code=404, detail=f"Part not found: {psel.part_id}")
                 qty = psel.qty or 1
                 part_items.append((p, qty))
         else:
-            p = db.query(PartModel).filter(PartModel.id == payload.part_id).first()
+            p = db.query(PartModel).options(raiseload('*')).filter(PartModel.id == payload.part_id).first()
             if not p:
                 raise HTTPException(status_code=404, detail="Part not found")
             part_items.append((p, 1))
@@ -1393,7 +1143,7 @@ async def calculate_price(payload: PriceCalculation, db: Session = Depends(get_d
             total_map += float(base or 0.0) * int(qty)
             part_codes.append(f"{p.code} x{qty}" if qty and qty != 1 else p.code)
 
-    formula = db.query(FormulaModel).filter(FormulaModel.id == payload.formula_id).first()
+    formula = db.get(FormulaModel, payload.formula_id)
     if not formula:
         raise HTTPException(status_code=404, detail="Formula not found")
 
@@ -1403,41 +1153,21 @@ async def calculate_price(payload: PriceCalculation, db: Session = Depends(get_d
     cust_type = (getattr(payload, 'customer_type', None) or 'customer').lower()
     is_dealer = cust_type == 'dealer'
 
-    labor_level = payload.labor_level
-    labor_cost = 0.0
-    labor_level_used = ''
-
     def get_level(formula_obj, level_name, dealer_level_name):
         if is_dealer and getattr(formula_obj, dealer_level_name, None) is not None:
             return float(getattr(formula_obj, dealer_level_name) or 0.0)
         return float(getattr(formula_obj, level_name) or 0.0)
 
-    if labor_level == '1' or labor_level == 1:
-        labor_cost = get_level(formula, 'labor_lvl1', 'dealer_labor_lvl1')
-        labor_level_used = '1'
-    elif labor_level == '2_major':
-        labor_cost = get_level(formula, 'labor_lvl2_major', 'dealer_labor_lvl2_major')
-        labor_level_used = '2_major'
-    elif labor_level == '2_minor':
-        labor_cost = get_level(formula, 'labor_lvl2_minor', 'dealer_labor_lvl2_minor')
-        labor_level_used = '2_minor'
-    elif labor_level == '3' or labor_level == 3:
-        labor_cost = get_level(formula, 'labor_lvl3', 'dealer_labor_lvl3')
-        labor_level_used = '3'
-    else:
-        # default choice order
-        if (is_dealer and formula.dealer_labor_lvl2_major is not None) or formula.labor_lvl2_major is not None:
-            labor_cost = get_level(formula, 'labor_lvl2_major', 'dealer_labor_lvl2_major')
-            labor_level_used = '2_major'
-        elif (is_dealer and formula.dealer_labor_lvl2_minor is not None) or formula.labor_lvl2_minor is not None:
-            labor_cost = get_level(formula, 'labor_lvl2_minor', 'dealer_labor_lvl2_minor')
-            labor_level_used = '2_minor'
-        elif (is_dealer and formula.dealer_labor_lvl1 is not None) or formula.labor_lvl1 is not None:
-            labor_cost = get_level(formula, 'labor_lvl1', 'dealer_labor_lvl1')
-            labor_level_used = '1'
+    labor_level_used = payload.labor_level
+    if labor_level_used not in LABOR_ATTRS:
+        # default choice order: first level set for this customer type, else 3
+        for labor_level_used in DEFAULT_LABOR_ORDER:
+            level_name, dealer_level_name = LABOR_ATTRS[labor_level_used]
+            if (is_dealer and getattr(formula, dealer_level_name) is not None) or getattr(formula, level_name) is not None:
+                break
         else:
-            labor_cost = get_level(formula, 'labor_lvl3', 'dealer_labor_lvl3')
             labor_level_used = '3'
+    labor_cost = get_level(formula, *LABOR_ATTRS[labor_level_used])
 
     # Margin percent (treat <1 as fractional), with class defaults when missing
     def default_margin_pct(class_name: Optional[str]) -> float:
@@ -0,0 +1,261 @@
+"""Samsung model detection over free text (part codes/descriptions).
+
+A SamsungMatcher is built once from the samsung_models rows and shared read-only
+across requests; main.py rebuilds it when the table changes.
+"""
+from collections import namedtuple
+from types import MappingProxyType
+from typing import Optional
+import re
+import threading
+
+from cachetools import LRUCache
+
+try:
+    import ahocorasick  # pyahocorasick: multi-pattern substring matching in C
+except ImportError:  # pragma: no cover - optional speedup, linear scan fallback below
+    ahocorasick = None
+
+_DIGITS_RE = re.compile(r"\d{3,4}")
+_BASE_CODE_RE = re.compile(r"^([A-Z]{2}-[A-Z0-9]*?\d+)", re.IGNORECASE)
+_CODE_BODY_RE = re.compile(r"^[A-Z]{1,2}-(\w+)$")
+_TRAILING_LETTER_RE = re.compile(r"[A-Z]$")
+_SM_LEAD_RE = re.compile(r"^(?:SM-)?([A-Z])")
+
+# Device filter keys whose SQL patterns are memoized per matcher; bounded because the
+# keys come straight from the ?device= query string
+DEVICE_PATTERNS_CACHE_SIZE = 1024
+
+# Tie-break for ambiguous numeric tails: highend > tab > wearable > midend > lowend
+_CATEGORY_PRIORITY = MappingProxyType({"highend": 4, "tab": 3, "wearable": 2, "midend": 1, "lowend": 0})
+
+# Detached, immutable view of a SamsungModel row, safe to share across requests/threads
+SamsungMatch = namedtuple('SamsungMatch', ['model_name', 'model_code', 'category'])
+
+
+def _base_code(code: Optional[str]) -> Optional[str]:
+    if not code:
+        return None
+    c = code.split('/')[0]
+    m = _BASE_CODE_RE.match(c)
+    return m.group(1).upper() if m else c.upper()
+
+
+def _device_code_patterns(c_full: str) -> set:
+    """SQL substring patterns (lowercase) for a Samsung model code and its variants"""
+    patterns = set()
+    def add(p: Optional[str]):
+        if p:
+            patterns.add(p.lower())
+
+    c_full_u = (c_full or '').upper()
+    add(c_full_u)
+    c_no_region = c_full_u.split('/')[0]
+    add(c_no_region)
+    c_no_sm = c_no_region.replace('SM-', '')
+    add(c_no_sm)
+    # Body after hyphen
+    m2 = _CODE_BODY_RE.match(c_no_region)
+    code_body = m2.group(1) if m2 else c_no_region
+    add(code_body)
+    code_body_nosuf = _TRAILING_LETTER_RE.sub("", code_body)
+    add(code_body_nosuf)
+    # Lead letter + numeric tail (e.g., S928)
+    mnum = _DIGITS_RE.search(code_body)
+    if mnum:
+        tail = mnum.group(0)
+        # determine lead letter
+        mlead = _SM_LEAD_RE.match(c_no_region)
+        lead = mlead.group(1) if mlead else ''
+        if lead:
+            add(f"{lead}{tail}")
+            add(f"SM-{lead}{tail}")
+        # Do NOT add tail alone to avoid false positives in SQL prefiltering
+    return patterns
+
+
+def _trigram_buckets(entries) -> tuple:
+    """({last 3 chars: [(rank, pattern, model), ...]}, [shorter patterns]), both in rank order.
+
+    rank is the position in entries. Keyed on the tail rather than the first character:
+    most codes start with 'sm-', which would leave one bucket holding nearly all of them.
+    """
+    buckets, short = {}, []
+    for rank, (pat, sm) in enumerate(entries):
+        if len(pat) >= 3:
+            buckets.setdefault(pat[-3:], []).append((rank, pat, sm))
+        else:
+            short.append((rank, pat, sm))
+    return buckets, short
+
+
+class SamsungMatcher:
+    """Match tables for detection, built from SamsungMatch rows (in id order).
+    Code/name patterns are pre-sorted longest first so detection never sorts.
+    """
+
+    def __init__(self, models):
+        code_entries = []  # (pattern_lower, model)
+        name_entries = []  # (name_lower, model)
+        tail_to_models = {}  # e.g., '928' -> [model, ...]
+        seen_codes = set()
+
+        for mobj in models:
+            if mobj.model_code:
+                c_full = mobj.model_code.upper()
+                # direct
+                code_entries.append((c_full.lower(), mobj))
+                seen_codes.add(c_full.lower())
+                # base (strip region and trailing letter segment)
+                b = _base_code(c_full)
+                if b and b.lower() != c_full.lower():
+                    code_entries.append((b.lower(), mobj))
+                    seen_codes.add(b.lower())
+                # also versions without SM-
+                c_no_region = c_full.split('/')[0]
+                c_no_sm = c_no_region.replace('SM-', '')
+                if c_no_sm and c_no_sm.lower() not in seen_codes:
+                    code_entries.append((c_no_sm.lower(), mobj))
+                    seen_codes.add(c_no_sm.lower())
+                # remove last trailing letter (e.g., S928B -> S928)
+                m2 = _CODE_BODY_RE.match(c_no_region)
+                code_body = m2.group(1) if m2 else c_no_region
+                code_body_nosuf = _TRAILING_LETTER_RE.sub("", code_body)
+                if code_body_nosuf and code_body_nosuf.lower() not in seen_codes:
+                    code_entries.append((code_body_nosuf.lower(), mobj))
+                    seen_codes.add(code_body_nosuf.lower())
+                # map numeric tail (e.g., S928B -> 928)
+                mnum = _DIGITS_RE.search(code_body)
+                if mnum:
+                    tail_to_models.setdefault(mnum.group(0), []).append(mobj)
+            if mobj.model_name and mobj.model_name.strip():
+                name_entries.append((mobj.model_name.strip().lower(), mobj))
+
+        # Stable sorts: among equal lengths the earlier model still wins, as before
+        self.code_entries = sorted(code_entries, key=lambda x: len(x[0]), reverse=True)
+        self.name_entries = sorted(name_entries, key=lambda x: len(x[0]), reverse=True)
+        self.tail_to_models = tail_to_models
+
+        # One automaton over every pattern, valued by its position in the scan order
+        # (codes longest-first, then names longest-first): the lowest-ranked hit is
+        # exactly what the linear scan would have returned first
+        self.automaton = None
+        if ahocorasick is not None and (self.code_entries or self.name_entries):
+            automaton = ahocorasick.Automaton()
+            for rank, (pat, sm) in enumerate(self.code_entries + self.name_entries):
+                if pat not in automaton:  # keep the first (best-ranked) model per pattern
+                    automaton.add_word(pat, (rank, sm))
+            automaton.make_automaton()
+            self.automaton = automaton
+
+        # Without the automaton: patterns bucketed by their last three characters (kept
+        # in scan order), so only buckets whose trigram occurs in the text are probed
+        self.code_buckets = _trigram_buckets(self.code_entries)
+        self.name_buckets = _trigram_buckets(self.name_entries)
+
+        # Device-key lookups (first model wins, like the .first() queries they replace)
+        self.models_by_code, self.models_by_name = {}, {}
+        for mobj in models:
+            if mobj.model_code:
+                self.models_by_code.setdefault(mobj.model_code.lower(), mobj)
+            if mobj.model_name:
+                self.models_by_name.setdefault(mobj.model_name.lower(), mobj)
+
+        self._device_patterns = LRUCache(maxsize=DEVICE_PATTERNS_CACHE_SIZE)  # device key -> SQL patterns
+        self._device_patterns_lock = threading.Lock()
+
+    def detect_lower(self, t: str) -> Optional[SamsungMatch]:
+        """Detection core; t must already be lowercased"""
+        if self.automaton is not None:
+            # Single pass over the text; code matches outrank name matches, longest first
+            best = None
+            for _, (rank, sm) in self.automaton.iter(t):
+                if best is None or rank < best[0]:
+                    best = (rank, sm)
+            if best is not None:
+                return best[1]
+        else:
+            # Prefer code matches, then name matches (longest first within each)
+            grams = {t[i:i + 3] for i in range(len(t) - 2)}
+            for buckets, short in (self.code_buckets, self.name_buckets):
+                best = None
+                for rank, pat, sm in short:
+                    if pat in t:
+                        best = (rank, sm)
+                        break
+                for g in grams:
+                    for rank, pat, sm in buckets.get(g, ()):
+                        if best is not None and rank >= best[0]:
+                            break
+                        if pat in t:
+                            best = (rank, sm)
+                            break
+                if best is not None:
+                    return best[1]
+        # Numeric-tail fallback: detect 3-4 digit sequences like '928' in 'oled928'
+        for mnd in _DIGITS_RE.finditer(t):
+            num = mnd.group(0)
+            cands = self.tail_to_models.get(num)
+            if not cands:
+                continue
+            if len(cands) == 1:
+                return cands[0]
+            # Disambiguate by preceding letter in text (a/s/m/x/p/t/r/l/e, etc.)
+            idx = mnd.start()
+            prev = t[idx - 1] if idx - 1 >= 0 else ''
+            if prev and prev.isalpha():
+                for cand in cands:
+                    cc = (cand.model_code or '').upper().split('/')[0]
+                    mlead = _SM_LEAD_RE.match(cc)
+                    lead = mlead.group(1).lower() if mlead else ''
+                    if lead and lead == prev:
+                        return cand
+            # If still ambiguous, take the best category (first model on ties)
+            return max(cands, key=lambda x: _CATEGORY_PRIORITY.get(getattr(x, 'category', None) or '', 0))
+        return None
+
+    def detect(self, text: Optional[str]) -> Optional[SamsungMatch]:
+        return self.detect_lower((text or "").lower())
+
+    def detect_batch(self, texts) -> list:
+        """Samsung match for each text, in input order"""
+        detect_lower = self.detect_lower
+        return [detect_lower(t.lower()) for t in texts]
+
+    def device_patterns(self, device: str) -> frozenset:
+        """SQL substring patterns for a device filter key, memoized (LRU-bounded) on the matcher"""
+        dev = (device or '').strip().lower()
+        with self._device_patterns_lock:
+            cached = self._device_patterns.get(dev)
+        if cached is not None:
+            return cached
+        # device key is "name||code" (lowercased). Extract both parts.
+        name_lc, code_lc = None, None
+        if '||' in dev:
+            parts_key = dev.split('||', 1)
+            name_lc = parts_key[0] or None
+            code_lc = parts_key[1] or None
+        else:
+            # Fallback: treat entire value as code
+            code_lc = dev
+        # Known Samsung models give more accurate patterns
+        model_obj = None
+        if code_lc:
+            model_obj = self.models_by_code.get(code_lc)
+        if not model_obj and name_lc:
+            model_obj = self.models_by_name.get(name_lc)
+
+        patterns = set()
+        if model_obj and model_obj.model_code:
+            patterns |= _device_code_patterns(model_obj.model_code)
+        elif code_lc:
+            patterns |= _device_code_patterns(code_lc)
+        if model_obj and model_obj.model_name:
+            patterns.add(model_obj.model_name.lower())
+        elif name_lc:
+            patterns.add(name_lc)
+
+        patterns = frozenset(patterns)
+        with self._device_patterns_lock:
+            self._device_patterns[dev] = patterns
+        return patterns
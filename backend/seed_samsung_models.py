@@ -1,6 +1,12 @@
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 from datetime import datetime, timezone
-from database import SessionLocal, SamsungModel as SamsungModelORM, ensure_schema, create_tables
+import hashlib
+import sys
+from types import MappingProxyType
+from sqlalchemy import and_, func, or_, select, text as sql_text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+from database import engine, SamsungModel as SamsungModelORM, init_db
 
 # Curated list of Samsung PHONE models (2014 and newer)
 # Categories: highend (S, Note, Z), midend (A3–A9), lowend (A0–A2, M, F, Xcover)
@@ -114,8 +120,11 @@ CURATED_WEARABLES: List[Tuple[str, str]] = [
     ("Galaxy Buds FE", "wearable"), ("Galaxy Buds3", "wearable"), ("Galaxy Buds3 Pro", "wearable"),
 ]
 
+# Every curated (model_name, category), in seed order; built once at import
+ALL_CURATED: Tuple[Tuple[str, str], ...] = tuple(CURATED_MODELS) + tuple(CURATED_TABS) + tuple(CURATED_WEARABLES)
+
 # Optional add-on: map of model_name -> model_code
-MODEL_CODES = {
+MODEL_CODES = MappingProxyType({
     # Legacy High-end S / Note (2014-2018)
     "Galaxy S5": "SM-G900F",
     "Galaxy Note4": "SM-N910F",
@@ -368,52 +377,75 @@ MODEL_CODES = {
     "Galaxy Buds FE": "SM-R400",
     "Galaxy Buds3": "SM-R530",
     "Galaxy Buds3 Pro": "SM-R630",
-}
+})
+
+# (model_name, category, model_code or None) per curated model, joined once at import
+SEED_ROWS: Tuple[Tuple[str, str, Optional[str]], ...] = tuple((n, c, MODEL_CODES.get(n)) for n, c in ALL_CURATED)
+
+# Fingerprint of the curated data; stored after a successful seed so unchanged reruns can skip
+SEED_HASH = hashlib.blake2b(repr(SEED_ROWS).encode(), digest_size=16).hexdigest()
+SEED_HASH_KEY = "samsung_seed_hash"
+
 
+def seed_models(force: bool = False):
+    """Upsert the curated Samsung models. Assumes the schema exists (init_db() has run)."""
+    # Plain Core connection (no ORM session needed): commits when the block completes,
+    # rolls back on error
+    with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            # Take SQLite's write lock up front so concurrently booting workers seed one
+            # at a time: a waiting worker then finds the fresh SEED_HASH and skips, and
+            # one that cannot get the lock within the busy timeout gives up
+            try:
+                conn.exec_driver_sql("BEGIN IMMEDIATE")
+            except OperationalError:
+                print("Samsung models seeding skipped: another process is seeding the database")
+                return
+        conn.execute(sql_text("CREATE TABLE IF NOT EXISTS app_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"))
+        stored = conn.scalar(sql_text("SELECT value FROM app_meta WHERE key = :key"), {"key": SEED_HASH_KEY})
+        if stored == SEED_HASH and not force:
+            print("Samsung models seeding skipped: curated list unchanged since the last seed (use --force to reapply)")
+            return
 
-def seed_models():
-    create_tables()
-    ensure_schema()
-    db = SessionLocal()
-    added = 0
-    updated = 0
-    try:
-        # Merge all curated items
-        all_items: List[Tuple[str, str]] = []
-        all_items.extend(CURATED_MODELS)
-        all_items.extend(CURATED_TABS)
-        all_items.extend(CURATED_WEARABLES)
+        # One timestamp for the whole seed run
+        now = datetime.now(timezone.utc)
+        # model_name is unique; a repeated curated name keeps its last entry
+        rows = {
+            model_name: {
+                "brand": "Samsung", "model_name": model_name, "category": category,
+                "model_code": code, "created_at": now, "updated_at": now,
+            }
+            for model_name, category, code in SEED_ROWS
+        }
 
-        for model_name, category in all_items:
-            existing = db.query(SamsungModelORM).filter(SamsungModelORM.model_name == model_name).first()
-            now = datetime.now(timezone.utc)
-            code = MODEL_CODES.get(model_name)
-            if existing:
-                # Update category and/or model_code
-                changed = False
-                if category and existing.category != category:
-                    existing.category = category
-                    changed = True
-                if code and getattr(existing, 'model_code', None) != code:
-                    existing.model_code = code
-                    changed = True
-                if changed:
-                    existing.updated_at = now
-                    updated += 1
-            else:
-                obj = SamsungModelORM(brand="Samsung", model_name=model_name, category=category, created_at=now, updated_at=now)
-                if code:
-                    obj.model_code = code
-                db.add(obj)
-                added += 1
-        db.commit()
-        print(f"Samsung models seeding completed. Added: {added}, Updated: {updated}")
-    except Exception:
-        db.rollback()
-        raise
-    finally:
-        db.close()
+        # One UPSERT for the whole list: new names are inserted; existing rows take a
+        # non-empty curated category/model_code, and only rows that actually change
+        # are written (and get a new updated_at)
+        stmt = sqlite_insert(SamsungModelORM).values(list(rows.values()))
+        excluded, table = stmt.excluded, SamsungModelORM.__table__.c
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["model_name"],
+            set_={
+                "category": func.coalesce(excluded.category, table.category),
+                "model_code": func.coalesce(excluded.model_code, table.model_code),
+                "updated_at": excluded.updated_at,
+            },
+            where=or_(
+                and_(excluded.category.is_not(None), table.category.is_distinct_from(excluded.category)),
+                and_(excluded.model_code.is_not(None), table.model_code.is_distinct_from(excluded.model_code)),
+            ),
+        )
+        before = conn.scalar(select(func.count()).select_from(SamsungModelORM))
+        written = conn.execute(stmt).rowcount
+        added = conn.scalar(select(func.count()).select_from(SamsungModelORM)) - before
+        updated = written - added
+        conn.execute(
+            sql_text("INSERT INTO app_meta (key, value) VALUES (:key, :value) ON CONFLICT(key) DO UPDATE SET value = excluded.value"),
+            {"key": SEED_HASH_KEY, "value": SEED_HASH},
+        )
+    print(f"Samsung models seeding completed. Added: {added}, Updated: {updated}")
 
 
 if __name__ == "__main__":
-    seed_models()
+    init_db()
+    seed_models(force="--force" in sys.argv[1:])
@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+
+# The app reads its configuration at import time, so point it at a scratch database first
+_DB_DIR = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'test.db')}"
+os.environ["ADMIN_USERNAME"] = "root"
+os.environ["ADMIN_PASSWORD"] = "rootpw"
+os.environ["BCRYPT_ROUNDS"] = "4"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(main.app) as c:
+        yield c
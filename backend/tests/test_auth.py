@@ -0,0 +1,46 @@
+def _login(client, username, password):
+    res = client.post("/token", data={"username": username, "password": password})
+    assert res.status_code == 200
+    return {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+
+def test_demoted_admin_is_refused_with_old_token(client):
+    root = _login(client, "root", "rootpw")
+    res = client.post("/admin/users", json={"username": "boss", "password": "bosspw", "role": "admin"}, headers=root)
+    assert res.status_code == 200
+    boss_id = res.json()["id"]
+
+    # Token issued while boss was an admin (its role claim says "admin")
+    boss = _login(client, "boss", "bosspw")
+    res = client.post("/parts/", json={"code": "TEST-DEMOTE-1"}, headers=boss)
+    assert res.status_code == 200
+    part_id = res.json()["id"]
+
+    assert client.put(f"/admin/users/{boss_id}", json={"role": "user"}, headers=root).status_code == 200
+
+    # Same, still valid token: every admin-only parts write must now be refused
+    assert client.post("/parts/", json={"code": "TEST-DEMOTE-2"}, headers=boss).status_code == 403
+    assert client.put(f"/parts/{part_id}", json={"stock_qty": 1}, headers=boss).status_code == 403
+    assert client.delete(f"/parts/{part_id}", headers=boss).status_code == 403
+
+    # Deactivating the ex-admin does not bring the access back either
+    assert client.put(f"/admin/users/{boss_id}", json={"is_active": "Inactive"}, headers=root).status_code == 200
+    assert client.post("/parts/", json={"code": "TEST-DEMOTE-3"}, headers=boss).status_code == 403
+
+    assert client.delete(f"/parts/{part_id}", headers=root).status_code == 204
+
+
+def test_expired_token_is_rejected_even_with_cached_user(client):
+    import time
+    from datetime import timedelta
+
+    from auth import create_access_token
+
+    token = create_access_token({"sub": "root", "role": "admin"}, expires_delta=timedelta(seconds=1))
+    headers = {"Authorization": f"Bearer {token}"}
+    # First request resolves the user and puts it in the user cache
+    assert client.get("/me", headers=headers).status_code == 200
+    time.sleep(2.1)
+    assert client.get("/me", headers=headers).status_code == 401
+    assert client.get("/admin/users", headers=headers).status_code == 401
+    assert client.post("/parts/", json={"code": "TEST-EXPIRED"}, headers=headers).status_code == 401
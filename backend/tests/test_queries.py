@@ -0,0 +1,59 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from database import engine
+
+
+def _login(client, username, password):
+    res = client.post("/token", data={"username": username, "password": password})
+    assert res.status_code == 200
+    return {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+
+@contextmanager
+def _count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_admin_users_lists_creators_without_per_row_queries(client):
+    root = _login(client, "root", "rootpw")
+    for i in range(3):
+        res = client.post("/admin/users", json={"username": f"q{i}", "password": "qpw"}, headers=root)
+        assert res.status_code == 200
+    # Warm the token/user caches so only the handler's own queries are counted
+    assert client.get("/admin/users", headers=root).status_code == 200
+
+    with _count_queries() as statements:
+        res = client.get("/admin/users", headers=root)
+    assert res.status_code == 200
+    users = {u["username"]: u for u in res.json()}
+    assert all(users[f"q{i}"]["created_by_username"] == "root" for i in range(3))
+    assert len(statements) <= 2, statements
+
+
+def test_calculate_price_loads_parts_in_one_query(client):
+    root = _login(client, "root", "rootpw")
+    part_ids = []
+    for i in range(3):
+        res = client.post("/parts/", json={"code": f"TEST-Q-{i}", "map_price": 10 * (i + 1)}, headers=root)
+        assert res.status_code == 200
+        part_ids.append(res.json()["id"])
+    res = client.post("/formulas/", json={"class_name": "TEST-Q", "labor_lvl3": 5, "exchange_rate": 1}, headers=root)
+    assert res.status_code == 200
+    payload = {"formula_id": res.json()["id"], "parts": [{"part_id": pid, "qty": 2} for pid in part_ids]}
+    assert client.post("/calculate-price", json=payload, headers=root).status_code == 200
+
+    with _count_queries() as statements:
+        res = client.post("/calculate-price", json=payload, headers=root)
+    assert res.status_code == 200
+    assert len(statements) <= 2, statements
@@ -28,6 +28,7 @@ const PriceCalculator = () => {
   const { data: parts = [] } = useQuery(['parts', partSearch], () => {
     const params = new URLSearchParams();
     params.append('limit', '10000');
+    params.append('include', 'samsung');
     if (partSearch) params.append('search', partSearch);
     return axios.get(`${API}/parts/?${params.toString()}`).then(res => res.data);
   });
@@ -65,6 +65,8 @@ const Parts = () => {
     if (deviceFilter) params.append('device', deviceFilter);
     params.append('skip', String(page * pageSize));
     params.append('limit', String(pageSize + 1));
+    // Table shows the matched Samsung model and category badges
+    params.append('include', 'samsung');
     const res = await axios.get(`${API}/parts/?${params.toString()}`);
     const items = Array.isArray(res.data) ? res.data : [];
     const hasNext = items.length > pageSize;